@@ -54,6 +54,8 @@ class Command(BaseCommand):
             
             with connection.cursor() as cursor:
                 cursor.execute(sql_content)
+                # Les catégories importées en SQL n'ont pas de chemin matérialisé
+                cursor.execute("SELECT rebuild_category_paths()")
             
             self.stdout.write(
                 self.style.SUCCESS('Données importées avec succès!')
@@ -63,29 +65,226 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Fichier SQL non trouvé: {sql_file}')
             )
 
+# management/commands/rebuild_category_paths.py
+# listings/management/commands/rebuild_category_paths.py
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+class Command(BaseCommand):
+    help = 'Recalcule le chemin matérialisé et la profondeur de toutes les catégories'
+    
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rebuild_category_paths()")
+            cursor.execute("SELECT count(*) FROM category WHERE path = ''")
+            orphans = cursor.fetchone()[0]
+        
+        if orphans:
+            self.stdout.write(
+                self.style.WARNING(f'{orphans} catégories sans chemin (parent introuvable).')
+            )
+        self.stdout.write(self.style.SUCCESS('Chemins des catégories recalculés.'))
+
 # management/commands/update_search_vectors.py
 # listings/management/commands/update_search_vectors.py
+import time
 from django.core.management.base import BaseCommand
-from django.db import connection
-from listings.models import Listing
+from django.db import connection, transaction
 
 class Command(BaseCommand):
-    help = 'Met à jour les vecteurs de recherche pour toutes les annonces'
+    help = 'Reconstruit les vecteurs de recherche par lots ensemblistes (reprise possible)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Nombre d\'ids traités par lot',
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=0,
+            help='Reprendre après cet id (dernier id affiché par un run précédent)',
+        )
     
     def handle(self, *args, **options):
-        listings = Listing.objects.all()
-        total = listings.count()
+        batch_size = options['batch_size']
+        last_id = options['start_id']
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM listing WHERE id > %s", [last_id])
+            total = cursor.fetchone()[0]
         
-        self.stdout.write(f'Mise à jour de {total} annonces...')
+        self.stdout.write(f'Mise à jour de {total} annonces (à partir de l\'id {last_id})...')
         
-        for i, listing in enumerate(listings, 1):
-            listing.update_search_vector()
+        processed = 0
+        started = time.monotonic()
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Borne haute du lot suivant (parcours de l'index primaire)
+                cursor.execute("""
+                    SELECT max(id) FROM (
+                        SELECT id FROM listing WHERE id > %s ORDER BY id LIMIT %s
+                    ) AS batch
+                """, [last_id, batch_size])
+                max_id = cursor.fetchone()[0]
+                if max_id is None:
+                    break
+                
+                cursor.execute(
+                    "SELECT refresh_listing_search_vectors(%s, %s)",
+                    [last_id, max_id]
+                )
+                processed += cursor.fetchone()[0]
             
-            if i % 100 == 0:
-                self.stdout.write(f'Traité {i}/{total} annonces')
+            last_id = max_id
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            self.stdout.write(
+                f'Traité {processed}/{total} annonces '
+                f'(dernier id: {last_id}, {rate:.0f} annonces/s)'
+            )
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Mise à jour terminée pour {processed} annonces!')
+        )
+
+# management/commands/reconcile_favorite_counts.py
+# listings/management/commands/reconcile_favorite_counts.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+class Command(BaseCommand):
+    help = 'Corrige les écarts de favorite_count par rapport à user_favorite (à planifier)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Nombre d\'ids d\'annonces vérifiés par lot',
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT coalesce(max(id), 0) FROM listing")
+            max_id = cursor.fetchone()[0]
+        
+        repaired = 0
+        for start in range(0, max_id, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Un seul GROUP BY par plage ; seules les lignes en écart sont réécrites
+                cursor.execute("""
+                    UPDATE listing l
+                    SET favorite_count = counts.total
+                    FROM (
+                        SELECT l2.id, count(f.id) AS total
+                        FROM listing l2
+                        LEFT JOIN user_favorite f ON f.listing_id = l2.id
+                        WHERE l2.id > %s AND l2.id <= %s
+                        GROUP BY l2.id
+                    ) AS counts
+                    WHERE l.id = counts.id
+                      AND l.favorite_count <> counts.total
+                """, [start, start + batch_size])
+                repaired += cursor.rowcount
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'{repaired} compteurs de favoris corrigés.')
+        )
+
+# management/commands/refresh_category_stats.py
+# listings/management/commands/refresh_category_stats.py
+from django.core.management.base import BaseCommand
+from listings.models import CategoryStats
+
+class Command(BaseCommand):
+    help = 'Recalcule les statistiques matérialisées de toutes les catégories (à planifier)'
+    
+    def handle(self, *args, **options):
+        count = CategoryStats.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(f'Statistiques recalculées pour {count} catégories.')
+        )
+
+# management/commands/recount_categories.py
+# listings/management/commands/recount_categories.py
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+class Command(BaseCommand):
+    help = 'Recalcule listing_count de toutes les catégories en un seul GROUP BY'
+    
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE category c
+                SET listing_count = counts.total
+                FROM (
+                    SELECT c2.id, count(l.id) AS total
+                    FROM category c2
+                    LEFT JOIN listing l ON l.category_id = c2.id AND l.status = 'active'
+                    GROUP BY c2.id
+                ) AS counts
+                WHERE c.id = counts.id
+                  AND c.listing_count <> counts.total
+            """)
+            repaired = cursor.rowcount
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'{repaired} compteurs de catégories corrigés.')
+        )
+
+# management/commands/recount_unread_messages.py
+# listings/management/commands/recount_unread_messages.py
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+class Command(BaseCommand):
+    help = 'Recalcule les non lus de toutes les conversations en un seul GROUP BY'
+    
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT recount_conversation_unread()")
+            repaired = cursor.fetchone()[0]
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'{repaired} compteurs de non lus corrigés.')
+        )
+
+# management/commands/generate_thumbnails.py
+# listings/management/commands/generate_thumbnails.py
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from listings.models import ListingImage
+from listings.thumbnails import generate_thumbnails, get_sizes, thumbnail_name
+
+class Command(BaseCommand):
+    help = 'Génère les miniatures (THUMBNAIL_SIZES + WebP) manquantes des images d\'annonces'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Régénérer les miniatures existantes')
+    
+    def handle(self, *args, **options):
+        sizes = list(get_sizes())
+        generated = failed = 0
+        for name in ListingImage.objects.exclude(image='').values_list('image', flat=True).iterator():
+            if not options['force'] and all(
+                default_storage.exists(thumbnail_name(name, size, webp=True)) for size in sizes
+            ):
+                continue
+            try:
+                generate_thumbnails(name)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Erreur avec {name}: {e}'))
         
         self.stdout.write(
-            self.style.SUCCESS(f'Mise à jour terminée pour {total} annonces!')
+            self.style.SUCCESS(f'Miniatures générées pour {generated} images ({failed} échecs).')
         )
 
 # management/commands/cleanup_expired.py
@@ -56,7 +56,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ['kind', 'is_active', 'depth', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ['depth', 'listing_count', 'created_at', 'updated_at']
+    readonly_fields = ['depth', 'path', 'listing_count', 'created_at', 'updated_at']
     inlines = [CategoryRelationInline]
     
     fieldsets = (
@@ -70,7 +70,7 @@ class CategoryAdmin(admin.ModelAdmin):
             'fields': ('is_active',)
         }),
         ('Métadonnées', {
-            'fields': ('depth', 'listing_count', 'created_at', 'updated_at'),
+            'fields': ('depth', 'path', 'listing_count', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         })
     )
@@ -167,7 +167,7 @@ class ListingImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover;" />',
-                obj.image.url
+                obj.thumbnail_url('small')
             )
         return "Pas d'image"
     image_preview.short_description = 'Aperçu'
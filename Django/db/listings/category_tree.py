@@ -0,0 +1,127 @@
+# listings/category_tree.py
+import threading
+import time
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+# Version partagée entre processus (Redis) : l'incrémenter invalide tous les arbres locaux
+VERSION_KEY = 'category_tree_version'
+
+_lock = threading.Lock()
+_local = {'version': None, 'tree': None}
+
+def _new_version():
+    # Valeur initiale horodatée : une clé évincée ne réutilise jamais une ancienne version
+    return int(time.time() * 1000)
+
+class CategoryNode:
+    """Noeud léger de l'arbre des catégories (sans accès base)"""
+    __slots__ = ('id', 'parent_id', 'name', 'slug', 'icon', 'depth', 'is_active', 'children', 'active_children')
+
+    def __init__(self, category):
+        self.id = category.id
+        self.parent_id = category.parent_id
+        self.name = category.name
+        self.slug = category.slug
+        self.icon = category.icon
+        self.depth = category.depth
+        self.is_active = category.is_active
+        self.children = []
+        # Enfants affichables (méga-menu) : actifs, d'un parent lui-même affiché
+        self.active_children = []
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('category_detail', kwargs={'slug': self.slug})
+
+class CategoryTree:
+    """Arbre des catégories construit à partir d'une seule requête"""
+
+    def __init__(self, categories):
+        self.nodes = {}
+        self.roots = []
+        # Les catégories arrivent triées (sort_order, name) : l'ordre des enfants suit
+        for category in categories:
+            self.nodes[category.id] = CategoryNode(category)
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_id)
+            if parent:
+                parent.children.append(node)
+                if node.is_active:
+                    parent.active_children.append(node)
+            elif node.parent_id is None:
+                self.roots.append(node)
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def subtree_ids(self, category_id):
+        """Ids de la catégorie et de tous ses descendants (actifs ou non)"""
+        ids = []
+        pending = [self.nodes[category_id]] if category_id in self.nodes else []
+        while pending:
+            node = pending.pop()
+            ids.append(node.id)
+            pending.extend(node.children)
+        return ids or [category_id]
+
+    def walk(self, nodes=None):
+        """Parcours en profondeur des catégories actives"""
+        for node in self.roots if nodes is None else nodes:
+            if not node.is_active:
+                continue
+            yield node
+            yield from self.walk(node.active_children)
+
+    def choices(self, empty_label='---------'):
+        """Choix indentés pour un champ de formulaire"""
+        choices = [('', empty_label)]
+        for node in self.walk():
+            if node.depth == 1:
+                choices.append((node.id, node.name))
+            else:
+                indent = ' ' * (3 * (node.depth - 1) - 1)
+                choices.append((node.id, f"{indent}└─ {node.name}"))
+        return choices
+
+    def menu(self):
+        """Catégories racines actives avec leurs enfants actifs (``active_children``)"""
+        return [node for node in self.roots if node.is_active]
+
+    def breadcrumb(self, category_id):
+        """Chemin de la racine jusqu'à la catégorie"""
+        breadcrumb = []
+        node = self.nodes.get(category_id)
+        while node:
+            breadcrumb.append(node)
+            node = self.nodes.get(node.parent_id)
+        return list(reversed(breadcrumb))
+
+def get_category_tree():
+    """Arbre des catégories mis en cache dans le processus"""
+    from .models import Category
+
+    version = cache.get_or_set(VERSION_KEY, _new_version, None)
+    if _local['version'] == version and _local['tree'] is not None:
+        return _local['tree']
+
+    with _lock:
+        if _local['version'] != version or _local['tree'] is None:
+            _local['tree'] = CategoryTree(Category.objects.order_by('sort_order', 'name'))
+            _local['version'] = version
+    return _local['tree']
+
+def invalidate_category_tree():
+    """Invalide l'arbre dans tous les processus"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _new_version(), None)
+    _local['tree'] = None
+
+def category_menu(request):
+    """Context processor : méga-menu des catégories"""
+    return {'category_menu': SimpleLazyObject(lambda: get_category_tree().menu())}
@@ -0,0 +1,106 @@
+# listings/counters.py
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+def apply_deltas(table, column, deltas):
+    """Applique {id: delta} à une colonne compteur en une seule requête UPDATE"""
+    rows = [(pk, delta) for pk, delta in deltas.items() if pk is not None and delta]
+    if not rows:
+        return 0
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {table} AS t
+            SET {column} = t.{column} + v.n
+            FROM (VALUES {values}) AS v(id, n)
+            WHERE t.id = v.id
+        """, params)
+    return len(rows)
+
+class ViewCounterBuffer:
+    """Accumule les vues en mémoire et les écrit par lots
+
+    Un thread de fond vide le tampon toutes les ``flush_interval`` secondes,
+    même sans nouvelle vue : la perte en cas d'arrêt brutal (SIGKILL, OOM)
+    est bornée par cet intervalle et par ``max_pending``.
+    """
+
+    def __init__(self, table, column, flush_interval, max_pending):
+        self.table = table
+        self.column = column
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = Counter()
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer_pid = None
+
+    def _ensure_timer(self):
+        # Démarré au premier usage dans chaque processus (les threads ne survivent pas au fork)
+        if self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        threading.Thread(target=self._run_timer, name='view-counter-flush', daemon=True).start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+                close_old_connections()
+
+    def add(self, pk, count=1):
+        """Enregistre une vue et vide le tampon si nécessaire"""
+        self._ensure_timer()
+        with self._lock:
+            self._pending[pk] += count
+            self._pending_total += count
+            due = (
+                self._pending_total >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Écrit les incréments en attente en une seule requête UPDATE"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            updated = apply_deltas(self.table, self.column, pending)
+        except Exception:
+            # Remettre les incréments dans le tampon pour le prochain vidage
+            logger.exception("Échec du vidage des compteurs de vues")
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+            return 0
+        return updated
+
+listing_views = ViewCounterBuffer(
+    table='listing',
+    column='view_count',
+    flush_interval=getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10),
+    max_pending=getattr(settings, 'VIEW_COUNT_MAX_PENDING', 500),
+)
+
+# Vider le tampon à l'arrêt du processus
+atexit.register(listing_views.flush)
@@ -4,6 +4,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from .models import Listing, Category, UserProfile, Message, UserRating, Tag
+from .category_tree import get_category_tree
 import re
 
 class CustomUserCreationForm(UserCreationForm):
@@ -127,19 +128,8 @@ class ListingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        # Organiser les catégories par hiérarchie
-        categories = Category.objects.filter(is_active=True).select_related('parent')
-        choices = [('', '---------')]
-        
-        # Grouper par catégorie parent
-        for category in categories.filter(parent__isnull=True):
-            choices.append((category.id, category.name))
-            for subcategory in categories.filter(parent=category):
-                choices.append((subcategory.id, f"  └─ {subcategory.name}"))
-                for subsubcategory in categories.filter(parent=subcategory):
-                    choices.append((subsubcategory.id, f"     └─ {subsubcategory.name}"))
-        
-        self.fields['category'].choices = choices
+        # Organiser les catégories par hiérarchie (arbre en cache)
+        self.fields['category'].choices = get_category_tree().choices()
         
         # Pré-remplir les tags si on modifie une annonce existante
         if self.instance.pk:
@@ -212,6 +202,7 @@ class ListingForm(forms.ModelForm):
 class ListingSearchForm(forms.Form):
     """Formulaire de recherche d'annonces"""
     SORT_CHOICES = [
+        ('relevance', 'Pertinence'),
         ('-created_at', 'Plus récentes'),
         ('price_cents', 'Prix croissant'),
         ('-price_cents', 'Prix décroissant'),
@@ -0,0 +1,78 @@
+# listings/home_cache.py
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+# Clé de version des blocs d'annonces : incrémentée par les signaux Listing
+LISTINGS_VERSION_KEY = 'home:listings_version'
+
+def _timeout(name, default):
+    return getattr(settings, 'HOME_CACHE_TIMEOUTS', {}).get(name, default)
+
+def get_home_stats():
+    """Statistiques globales (trois COUNT mis en cache avec TTL)"""
+    from .models import Listing, Category, UserProfile
+
+    def compute():
+        return {
+            'total_listings': Listing.objects.active().count(),
+            'total_users': UserProfile.objects.filter(status='active').count(),
+            'total_categories': Category.objects.filter(is_active=True).count(),
+        }
+    return cache.get_or_set('home:stats', compute, _timeout('stats', 300))
+
+def get_main_categories():
+    """Catégories racines actives (mises en cache avec TTL)"""
+    from .models import Category
+
+    def compute():
+        return list(Category.objects.filter(
+            parent__isnull=True,
+            is_active=True
+        ).order_by('sort_order'))
+    return cache.get_or_set('home:categories', compute, _timeout('categories', 3600))
+
+def _get_home_listing_ids():
+    from .models import Listing
+
+    version = cache.get_or_set(LISTINGS_VERSION_KEY, lambda: int(time.time() * 1000), None)
+
+    def compute():
+        return {
+            'featured': list(Listing.objects.featured().values_list('id', flat=True)[:6]),
+            'recent': list(Listing.objects.active().values_list('id', flat=True)[:12]),
+        }
+    # La TTL couvre l'expiration des mises en avant, qui ne déclenche aucun signal
+    return cache.get_or_set(f'home:listing_ids:{version}', compute, _timeout('listings', 600))
+
+def get_home_listings():
+    """Annonces mises en avant et récentes, hydratées en une seule requête"""
+    from .models import Listing, ListingImage
+
+    ids = _get_home_listing_ids()
+    primary_image = ListingImage.objects.filter(
+        listing=OuterRef('pk'),
+        is_primary=True
+    ).values('image')[:1]
+    listings = Listing.objects.filter(
+        id__in=set(ids['featured']) | set(ids['recent'])
+    ).select_related(
+        'category', 'user__profile'
+    ).annotate(primary_image_name=Subquery(primary_image))
+    by_id = {listing.id: listing for listing in listings}
+    return (
+        [by_id[pk] for pk in ids['featured'] if pk in by_id],
+        [by_id[pk] for pk in ids['recent'] if pk in by_id],
+    )
+
+def invalidate_home_listings():
+    """Nouvelle version des blocs d'annonces de la page d'accueil"""
+    try:
+        cache.incr(LISTINGS_VERSION_KEY)
+    except ValueError:
+        cache.set(LISTINGS_VERSION_KEY, int(time.time() * 1000), None)
+
+def invalidate_home_categories():
+    """Supprime les catégories de la page d'accueil du cache"""
+    cache.delete('home:categories')
@@ -0,0 +1,186 @@
+# listings/pagination.py
+import base64
+import datetime
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+class InvalidCursor(Exception):
+    pass
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """Dates en pleine précision (DjangoJSONEncoder tronque à la milliseconde)"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def _encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+
+class KeysetPage:
+    """Page obtenue par curseur (pas d'OFFSET ni de COUNT)"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+class KeysetPaginator:
+    """Pagination par curseur sur un tri (ex: '-created_at'), départagé par l'id
+
+    Les valeurs NULL suivent l'ordre par défaut de PostgreSQL
+    (NULLS LAST en ASC, NULLS FIRST en DESC).
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        ordering = [key for key in ordering if key.lstrip('-') not in ('id', 'pk')]
+        tie_breaker = '-id' if ordering and ordering[0].startswith('-') else 'id'
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering + [tie_breaker]
+        self.fields = [key.lstrip('-') for key in self.ordering]
+
+    def _after(self, values, ordering):
+        """Condition « strictement après » la position donnée"""
+        condition = Q()
+        equal = Q()
+        for key, value in zip(ordering, values):
+            field = key.lstrip('-')
+            descending = key.startswith('-')
+            if value is None:
+                # NULL en tête (DESC) : toutes les valeurs non nulles suivent
+                step = Q(**{f'{field}__isnull': False}) if descending else Q(pk__in=[])
+                same = Q(**{f'{field}__isnull': True})
+            else:
+                lookup = 'lt' if descending else 'gt'
+                step = Q(**{f'{field}__{lookup}': value})
+                if not descending:
+                    # NULL en queue (ASC)
+                    step |= Q(**{f'{field}__isnull': True})
+                same = Q(**{field: value})
+            condition |= equal & step
+            equal &= same
+        return condition
+
+    def _position(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def get_page(self, cursor=None, total=None):
+        direction = 'next'
+        ordering = self.ordering
+        queryset = self.queryset
+        if cursor:
+            values, direction = _decode_cursor(cursor)
+            if len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            if direction == 'previous':
+                ordering = [key[1:] if key.startswith('-') else f'-{key}' for key in ordering]
+            queryset = queryset.filter(self._after(values, ordering))
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'previous':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or direction == 'previous':
+                next_cursor = _encode_cursor(self._position(rows[-1]), 'next')
+            if cursor and (has_more or direction == 'next'):
+                previous_cursor = _encode_cursor(self._position(rows[0]), 'previous')
+        return KeysetPage(rows, next_cursor, previous_cursor, total)
+
+def estimated_table_count(table):
+    """Nombre de lignes estimé par PostgreSQL (pg_class.reltuples)"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE relname = %s", [table])
+        row = cursor.fetchone()
+    return max(row[0], 0) if row else 0
+
+def count_cache_key(request, ignored=('page', 'cursor', 'sort_by')):
+    """Clé du total d'une liste publique : chemin et filtres de la requête
+
+    Le SQL ne peut pas servir de clé : active() y place l'heure courante.
+    La pagination et le tri ne changent pas le total.
+    """
+    filters = sorted(
+        (name, value)
+        for name, values in request.GET.lists() if name not in ignored
+        for value in values
+    )
+    raw = json.dumps([request.path, filters])
+    return 'count:' + hashlib.md5(raw.encode()).hexdigest()
+
+def cached_count(queryset, key=None, timeout=None):
+    """COUNT(*) mis en cache sous ``key`` (total approximatif) ; sans clé, compté à chaque fois"""
+    if not queryset.query.where:
+        # Table entière : l'estimation du planificateur suffit
+        return estimated_table_count(queryset.model._meta.db_table)
+    if key is None:
+        return queryset.count()
+    if timeout is None:
+        timeout = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 300)
+    return cache.get_or_set(key, queryset.count, timeout)
+
+class CachedCountPaginator(Paginator):
+    """Paginator par OFFSET dont le total est mis en cache sous ``count_key``"""
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_key)
+
+def paginate(request, queryset, ordering, per_page=None, with_total=False, count_key=None):
+    """Page par curseur si ?cursor= est présent (clients AJAX/API), sinon par OFFSET
+
+    En mode curseur, ``with_total`` ajoute un total approximatif. Le total
+    n'est mis en cache que sous ``count_key`` (voir count_cache_key).
+    """
+    per_page = per_page or getattr(settings, 'PAGINATE_BY', 20)
+    if 'cursor' in request.GET:
+        paginator = KeysetPaginator(queryset, per_page, ordering)
+        total = cached_count(queryset, count_key) if with_total else None
+        try:
+            return paginator.get_page(request.GET.get('cursor'), total)
+        except InvalidCursor:
+            return paginator.get_page(total=total)
+    paginator = CachedCountPaginator(queryset.order_by(*ordering), per_page, count_key)
+    return paginator.get_page(request.GET.get('page'))
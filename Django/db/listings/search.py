@@ -0,0 +1,20 @@
+# listings/search.py
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+
+# Configuration full-text PostgreSQL : doit rester celle de listing_search_document()
+# (schema_hybride.sql), sinon les vecteurs stockés ne correspondent plus aux requêtes
+SEARCH_LANGUAGE = 'french'
+
+def build_search_query(query):
+    """Construit la requête full-text (syntaxe type moteur de recherche)"""
+    return SearchQuery(query, config=SEARCH_LANGUAGE, search_type='websearch')
+
+def search_listings(queryset, query):
+    """Filtre les annonces sur search_vector (index GIN) et ajoute le rang"""
+    search_query = build_search_query(query)
+    return queryset.filter(
+        search_vector=search_query
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    )
@@ -1,8 +1,14 @@
 # listings/signals.py
+from collections import Counter
+from django.db import models, transaction
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, Listing, Category, UserRating, ListingTag, Tag
+from .models import UserProfile, Listing, ListingImage, Category, UserRating, ListingTag, Tag
+from .category_tree import invalidate_category_tree
+from .home_cache import invalidate_home_listings, invalidate_home_categories
+from .counters import apply_deltas
+from .thumbnails import schedule_thumbnails, delete_thumbnails
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -16,55 +22,54 @@ def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
 
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree_on_change(sender, instance, **kwargs):
+    """Invalider l'arbre des catégories et les catégories de l'accueil en cache"""
+    invalidate_category_tree()
+    invalidate_home_categories()
+
 @receiver(post_save, sender=Listing)
-def update_category_listing_count_on_create(sender, instance, created, **kwargs):
-    """Mettre à jour le compteur d'annonces de la catégorie lors de la création"""
-    if created and instance.status == 'active':
-        Category.objects.filter(id=instance.category_id).update(
-            listing_count=models.F('listing_count') + 1
-        )
+def invalidate_home_listings_on_change(sender, instance, created, **kwargs):
+    """Nouvelle version des blocs de la page d'accueil (création ou changement de statut)"""
+    if (
+        created
+        or instance.get_loaded_value('status') != instance.status
+        or instance.get_loaded_value('featured_until') != instance.featured_until
+    ):
+        invalidate_home_listings()
+
+@receiver(post_delete, sender=Listing)
+def invalidate_home_listings_on_delete(sender, instance, **kwargs):
+    """Retirer une annonce supprimée de la page d'accueil"""
+    invalidate_home_listings()
 
 @receiver(post_save, sender=Listing)
-def update_category_listing_count_on_update(sender, instance, created, **kwargs):
-    """Mettre à jour le compteur lors de la modification du statut"""
+def update_category_listing_count_on_save(sender, instance, created, **kwargs):
+    """Mettre à jour le compteur d'annonces actives des catégories
+
+    L'ancien état vient des valeurs chargées (Listing.from_db) : aucune relecture
+    en base, et une seule requête UPDATE même si statut et catégorie changent.
+    """
+    deltas = Counter()
     if not created:
-        # Récupérer l'ancien état depuis la base
-        try:
-            old_instance = Listing.objects.get(pk=instance.pk)
-            
-            # Si le statut change de/vers active
-            if old_instance.status != instance.status:
-                if old_instance.status == 'active' and instance.status != 'active':
-                    # Retirer une annonce active
-                    Category.objects.filter(id=instance.category_id).update(
-                        listing_count=models.F('listing_count') - 1
-                    )
-                elif old_instance.status != 'active' and instance.status == 'active':
-                    # Ajouter une annonce active
-                    Category.objects.filter(id=instance.category_id).update(
-                        listing_count=models.F('listing_count') + 1
-                    )
-            
-            # Si la catégorie change
-            if old_instance.category_id != instance.category_id:
-                if old_instance.status == 'active':
-                    # Retirer de l'ancienne catégorie
-                    Category.objects.filter(id=old_instance.category_id).update(
-                        listing_count=models.F('listing_count') - 1
-                    )
-                if instance.status == 'active':
-                    # Ajouter à la nouvelle catégorie
-                    Category.objects.filter(id=instance.category_id).update(
-                        listing_count=models.F('listing_count') + 1
-                    )
-        except Listing.DoesNotExist:
-            pass
+        loaded = getattr(instance, '_loaded_values', {})
+        if 'status' not in loaded or 'category_id' not in loaded:
+            # État antérieur inconnu : la commande recount_categories corrigera
+            return
+        if loaded['status'] == 'active':
+            deltas[loaded['category_id']] -= 1
+    if instance.status == 'active':
+        deltas[instance.category_id] += 1
+    apply_deltas('category', 'listing_count', deltas)
 
 @receiver(post_delete, sender=Listing)
 def update_category_listing_count_on_delete(sender, instance, **kwargs):
     """Mettre à jour le compteur lors de la suppression"""
-    if instance.status == 'active':
-        Category.objects.filter(id=instance.category_id).update(
+    # Compter selon l'état en base (celui qui avait été comptabilisé)
+    if instance.get_loaded_value('status', instance.status) == 'active':
+        category_id = instance.get_loaded_value('category_id', instance.category_id)
+        Category.objects.filter(id=category_id).update(
             listing_count=models.F('listing_count') - 1
         )
 
@@ -97,4 +102,19 @@ def update_tag_usage_count(sender, instance, action, pk_set, **kwargs):
         current_tags = instance.tags.all()
         Tag.objects.filter(pk__in=[tag.pk for tag in current_tags]).update(
             usage_count=models.F('usage_count') - 1
-        )
\ No newline at end of file
+        )
+
+@receiver(post_save, sender=ListingImage)
+def generate_listing_image_thumbnails(sender, instance, created, **kwargs):
+    """Miniatures générées en arrière-plan après le commit (nouvelle image ou remplacement)"""
+    if instance.image and (created or instance.image_changed()):
+        name = instance.image.name
+        transaction.on_commit(lambda: schedule_thumbnails(name))
+    instance._loaded_image = instance.image.name
+
+@receiver(post_delete, sender=ListingImage)
+def delete_listing_image_thumbnails(sender, instance, **kwargs):
+    """Supprimer les miniatures avec l'image"""
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: delete_thumbnails(name))
@@ -0,0 +1,15 @@
+# listings/templatetags/listing_thumbnails.py
+from django import template
+from ..thumbnails import thumbnail_url
+
+register = template.Library()
+
+@register.filter
+def thumbnail(image, size='medium'):
+    """URL de la miniature : {{ image.image|thumbnail:"small" }} ou {{ listing.primary_image_name|thumbnail }}"""
+    return thumbnail_url(getattr(image, 'name', image), size)
+
+@register.filter
+def thumbnail_webp(image, size='medium'):
+    """URL de la variante WebP (pour <source type="image/webp">)"""
+    return thumbnail_url(getattr(image, 'name', image), size, webp=True)
@@ -0,0 +1,121 @@
+# listings/thumbnails.py
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Génération en arrière-plan, hors du cycle requête/réponse
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+    thread_name_prefix='thumbnails'
+)
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {})
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+def thumbnail_name(name, size, webp=False, alpha=False):
+    """Nom du dérivé, à côté de l'original : listings/photo.jpg -> listings/photo_medium.jpg"""
+    root, _ = os.path.splitext(name)
+    extension = 'webp' if webp else ('png' if alpha else 'jpg')
+    return f'{root}_{size}.{extension}'
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    elif fmt == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+def generate_thumbnails(name, sizes=None, storage=default_storage):
+    """Produit les dérivés (format d'origine + WebP) d'une image pour chaque taille
+
+    L'original n'est décodé qu'une fois ; les tailles sont produites de la plus
+    grande à la plus petite à partir de la réduction précédente.
+    """
+    all_sizes = get_sizes()
+    sizes = sizes or list(all_sizes)
+    generated = {}
+    with storage.open(name, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    alpha = _has_alpha(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if alpha else 'RGB')
+
+    for size in sorted(sizes, key=lambda s: all_sizes[s][0] * all_sizes[s][1], reverse=True):
+        image.thumbnail(all_sizes[size], Image.LANCZOS)
+        for webp in (False, True):
+            derivative = thumbnail_name(name, size, webp, alpha)
+            fmt = 'WEBP' if webp else ('PNG' if alpha else 'JPEG')
+            if storage.exists(derivative):
+                storage.delete(derivative)
+            storage.save(derivative, ContentFile(_encode(image, fmt)))
+            cache.set(_cache_key(name, size, webp), derivative, None)
+            generated[(size, webp)] = derivative
+    return generated
+
+def delete_thumbnails(name, storage=default_storage):
+    """Supprime les dérivés d'une image"""
+    for size in get_sizes():
+        for webp in (False, True):
+            for alpha in (False, True):
+                derivative = thumbnail_name(name, size, webp, alpha)
+                if storage.exists(derivative):
+                    storage.delete(derivative)
+            cache.delete(_cache_key(name, size, webp))
+
+def _cache_key(name, size, webp):
+    return f'thumb:{size}:{int(webp)}:{name}'
+
+def _generate_safely(name):
+    try:
+        generate_thumbnails(name)
+    except Exception:
+        logger.exception("Échec de la génération des miniatures de %s", name)
+
+def schedule_thumbnails(name):
+    """Génère les dérivés en arrière-plan (ou immédiatement si THUMBNAIL_ASYNC=False)"""
+    if not name:
+        return
+    if getattr(settings, 'THUMBNAIL_ASYNC', True):
+        _executor.submit(_generate_safely, name)
+    else:
+        _generate_safely(name)
+
+def thumbnail_url(name, size='medium', webp=False, storage=default_storage):
+    """URL d'un dérivé ; tant qu'il manque, l'URL de l'original
+
+    Le dérivé n'est jamais produit dans la requête : sa génération est
+    planifiée une fois par quart d'heure au plus.
+    """
+    if not name:
+        return ''
+    if size not in get_sizes():
+        return storage.url(name)
+    key = _cache_key(name, size, webp)
+    derivative = cache.get(key)
+    if derivative is None:
+        derivative = next(
+            (candidate for candidate in (thumbnail_name(name, size, webp, alpha) for alpha in (False, True))
+             if storage.exists(candidate)),
+            None
+        )
+        if derivative is None:
+            if cache.add(f'thumb:pending:{name}', 1, 900):
+                schedule_thumbnails(name)
+            return storage.url(name)
+        cache.set(key, derivative, None)
+    return storage.url(derivative)
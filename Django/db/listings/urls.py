@@ -27,6 +27,7 @@ urlpatterns = [
     # Conversations
     path('conversations/', views.conversation_list, name='conversation_list'),
     path('conversations/<int:pk>/', views.conversation_detail, name='conversation_detail'),
+    path('conversations/<int:pk>/messages/', views.conversation_messages, name='conversation_messages'),
     
     # AJAX
     path('ajax/search/', views.search_ajax, name='search_ajax'),
@@ -1,54 +1,41 @@
 # listings/views.py
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.db.models import Q, F
-from django.db import connection
+from django.db import connection, transaction
 from django.http import JsonResponse, Http404
 from django.urls import reverse
 from django.views.decorators.http import require_POST
-from django.contrib.postgres.search import SearchVector, SearchQuery
 from django.utils import timezone
 from .models import (
-    Listing, Category, UserProfile, UserFavorite, 
+    Listing, Category, CategoryStats, UserProfile, UserFavorite, 
     Conversation, Message, UserRating, Tag
 )
 from .forms import (
     ListingForm, ListingSearchForm, CustomUserCreationForm, 
     UserProfileForm, MessageForm, UserRatingForm, ContactSellerForm
 )
+from .search import search_listings
+from .pagination import count_cache_key, paginate, KeysetPage, KeysetPaginator, InvalidCursor
+from .home_cache import get_home_listings, get_home_stats, get_main_categories
 import json
 
 def home(request):
-    """Page d'accueil avec annonces récentes et catégories"""
-    # Annonces mises en avant
-    featured_listings = Listing.objects.featured()[:6]
-    
-    # Annonces récentes
-    recent_listings = Listing.objects.active().select_related(
-        'category', 'user__profile'
-    ).prefetch_related('images')[:12]
-    
-    # Catégories principales
-    main_categories = Category.objects.filter(
-        parent__isnull=True, 
-        is_active=True
-    ).order_by('sort_order')
-    
-    # Statistiques
-    stats = {
-        'total_listings': Listing.objects.active().count(),
-        'total_users': UserProfile.objects.filter(status='active').count(),
-        'total_categories': Category.objects.filter(is_active=True).count(),
-    }
+    """Page d'accueil avec annonces récentes et catégories
+
+    Les blocs sont en cache : une page chaude ne fait qu'une requête
+    (hydratation des annonces à partir des ids mis en cache).
+    """
+    featured_listings, recent_listings = get_home_listings()
     
     context = {
         'featured_listings': featured_listings,
         'recent_listings': recent_listings,
-        'main_categories': main_categories,
-        'stats': stats,
+        'main_categories': get_main_categories(),
+        'stats': get_home_stats(),
     }
     
     return render(request, 'listings/home.html', context)
@@ -64,19 +51,14 @@ def listing_list(request):
         # Recherche textuelle
         query = form.cleaned_data.get('query')
         if query:
-            listings = listings.filter(
-                Q(title__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query)
-            )
+            # Recherche full-text sur search_vector (index GIN)
+            listings = search_listings(listings, query)
         
         # Filtre par catégorie
         category = form.cleaned_data.get('category')
         if category:
-            # Inclure les sous-catégories
-            subcategories = category.get_descendants()
-            category_ids = [category.id] + [cat.id for cat in subcategories]
-            listings = listings.filter(category_id__in=category_ids)
+            # Inclure les sous-catégories (jointure sur le chemin matérialisé)
+            listings = listings.filter(category.subtree_q('category__'))
         
         # Filtre par prix
         min_price = form.cleaned_data.get('min_price')
@@ -96,19 +78,24 @@ def listing_list(request):
         if location:
             listings = listings.filter(location__icontains=location)
         
-        # Tri
-        sort_by = form.cleaned_data.get('sort_by', '-created_at')
-        listings = listings.order_by(sort_by)
+        # Tri (pertinence : rang plein texte, uniquement avec une recherche)
+        sort_by = form.cleaned_data.get('sort_by')
+        if sort_by in ('', 'relevance'):
+            ordering = ['-rank', '-created_at'] if query else ['-created_at']
+        else:
+            ordering = [sort_by]
+    else:
+        ordering = ['-created_at']
     
-    # Pagination
-    paginator = Paginator(listings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (par curseur avec ?cursor=, total approximatif en cache)
+    page_obj = paginate(
+        request, listings, ordering, with_total=True, count_key=count_cache_key(request)
+    )
     
     context = {
         'form': form,
         'page_obj': page_obj,
-        'listings_count': paginator.count,
+        'listings_count': page_obj.total if isinstance(page_obj, KeysetPage) else page_obj.paginator.count,
     }
     
     return render(request, 'listings/listing_list.html', context)
@@ -213,23 +200,18 @@ def category_detail(request, slug):
     """Annonces d'une catégorie"""
     category = get_object_or_404(Category, slug=slug, is_active=True)
     
-    # Inclure les sous-catégories
-    subcategories = category.get_descendants()
-    category_ids = [category.id] + [cat.id for cat in subcategories]
-    
+    # Inclure les sous-catégories (jointure sur le chemin matérialisé)
     listings = Listing.objects.active().filter(
-        category_id__in=category_ids
+        category.subtree_q('category__')
     ).select_related('category', 'user__profile').prefetch_related('images')
     
-    # Pagination
-    paginator = Paginator(listings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (total en cache par catégorie et filtres)
+    page_obj = paginate(request, listings, ['-created_at'], count_key=count_cache_key(request))
     
-    # Statistiques de la catégorie
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_category_stats(%s)", [category.id])
-        stats = cursor.fetchone()
+    # Statistiques matérialisées (fraîcheur bornée par CATEGORY_STATS_MAX_AGE)
+    stats = CategoryStats.for_category(
+        category, getattr(settings, 'CATEGORY_STATS_MAX_AGE', 900)
+    )
     
     context = {
         'category': category,
@@ -237,11 +219,11 @@ def category_detail(request, slug):
         'page_obj': page_obj,
         'breadcrumb': category.get_breadcrumb(),
         'stats': {
-            'total_listings': stats[0] if stats else 0,
-            'active_listings': stats[1] if stats else 0,
-            'avg_price': stats[2] if stats else 0,
-            'min_price': stats[3] if stats else 0,
-            'max_price': stats[4] if stats else 0,
+            'total_listings': stats.total_listings,
+            'active_listings': stats.active_listings,
+            'avg_price': stats.avg_price or 0,
+            'min_price': stats.min_price or 0,
+            'max_price': stats.max_price or 0,
         } if stats else None,
     }
     
@@ -250,26 +232,44 @@ def category_detail(request, slug):
 @login_required
 @require_POST
 def toggle_favorite(request, slug):
-    """Ajouter/retirer des favoris (AJAX)"""
-    listing = get_object_or_404(Listing, slug=slug, status='active')
-    
-    favorite, created = UserFavorite.objects.get_or_create(
-        user=request.user,
-        listing=listing
-    )
-    
-    if not created:
-        favorite.delete()
-        is_favorited = False
-        action = 'removed'
+    """Ajouter/retirer des favoris (AJAX)
+
+    Le paramètre POST optionnel ``action`` ('add' ou 'remove') rend l'appel
+    idempotent ; sans lui, l'état est inversé.
+    """
+    listing = get_object_or_404(Listing.objects.only('id'), slug=slug, status='active')
+    action = request.POST.get('action')
+    
+    with transaction.atomic():
+        delta = 0
+        if action != 'add':
+            deleted, _ = UserFavorite.objects.filter(user=request.user, listing=listing).delete()
+            delta = -deleted
+        
+        with connection.cursor() as cursor:
+            if action != 'remove' and not delta:
+                # INSERT idempotent : un double clic concurrent n'ajoute qu'une ligne
+                cursor.execute("""
+                    INSERT INTO user_favorite (user_id, listing_id, created_at)
+                    VALUES (%s, %s, now())
+                    ON CONFLICT (user_id, listing_id) DO NOTHING
+                """, [request.user.id, listing.id])
+                delta = cursor.rowcount
+            
+            # Mise à jour du compteur par delta dans la même transaction
+            cursor.execute("""
+                UPDATE listing SET favorite_count = favorite_count + %s
+                WHERE id = %s
+                RETURNING favorite_count
+            """, [delta, listing.id])
+            favorite_count = cursor.fetchone()[0]
+    
+    if delta > 0:
+        is_favorited, action = True, 'added'
+    elif delta < 0:
+        is_favorited, action = False, 'removed'
     else:
-        is_favorited = True
-        action = 'added'
-    
-    # Mettre à jour le compteur
-    favorite_count = listing.favorites.count()
-    listing.favorite_count = favorite_count
-    listing.save(update_fields=['favorite_count'])
+        is_favorited, action = action != 'remove', 'unchanged'
     
     return JsonResponse({
         'is_favorited': is_favorited,
@@ -286,9 +286,7 @@ def user_favorites(request):
         'listing__category', 'listing__user__profile'
     ).prefetch_related('listing__images')
     
-    paginator = Paginator(favorites, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, favorites, ['-created_at'])
     
     return render(request, 'listings/user_favorites.html', {
         'page_obj': page_obj,
@@ -301,9 +299,7 @@ def user_listings(request):
         user=request.user
     ).exclude(status='deleted').select_related('category').prefetch_related('images')
     
-    paginator = Paginator(listings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, listings, ['-created_at'])
     
     return render(request, 'listings/user_listings.html', {
         'page_obj': page_obj,
@@ -376,16 +372,8 @@ def contact_seller(request, slug):
                 defaults={'is_active': True}
             )
             
-            # Créer le message
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                content=form.cleaned_data['message']
-            )
-            
-            # Mettre à jour la conversation
-            conversation.last_message_at = timezone.now()
-            conversation.save()
+            # Créer le message (met à jour la conversation et les non lus)
+            conversation.add_message(request.user, form.cleaned_data['message'])
             
             # Incrémenter le compteur de contacts
             listing.contact_count = F('contact_count') + 1
@@ -404,20 +392,15 @@ def contact_seller(request, slug):
 @login_required
 def conversation_list(request):
     """Liste des conversations de l'utilisateur"""
-    conversations = Conversation.objects.filter(
-        Q(buyer=request.user) | Q(seller=request.user),
-        is_active=True
-    ).select_related(
-        'listing', 'buyer__profile', 'seller__profile'
-    ).prefetch_related('messages').order_by('-last_message_at')
+    # Dernier message et non lus annotés : une seule requête
+    conversations = Conversation.objects.inbox(request.user)
     
     return render(request, 'listings/conversation_list.html', {
         'conversations': conversations,
     })
 
-@login_required
-def conversation_detail(request, pk):
-    """Détail d'une conversation avec messages"""
+def _get_participant_conversation(request, pk):
+    """Conversation dont l'utilisateur courant est participant (sinon 404)"""
     conversation = get_object_or_404(
         Conversation.objects.select_related(
             'listing', 'buyer__profile', 'seller__profile'
@@ -426,48 +409,77 @@ def conversation_detail(request, pk):
     )
     
     # Vérifier que l'utilisateur est participant
-    if request.user not in [conversation.buyer, conversation.seller]:
+    if request.user.pk not in [conversation.buyer_id, conversation.seller_id]:
         raise Http404("Conversation non trouvée")
-    
-    messages_list = conversation.messages.select_related('sender').order_by('created_at')
-    
-    # Marquer les messages comme lus
-    unread_messages = messages_list.filter(
-        read_at__isnull=True
-    ).exclude(sender=request.user)
-    unread_messages.update(
-        read_at=timezone.now(),
-        status='read'
+    return conversation
+
+def _message_page(conversation, cursor=None):
+    """Fenêtre de messages, du plus récent au plus ancien (curseur vers les anciens)"""
+    paginator = KeysetPaginator(
+        conversation.messages.select_related('sender'),
+        getattr(settings, 'MESSAGES_PAGE_SIZE', 30),
+        ['-created_at']
     )
+    try:
+        return paginator.get_page(cursor)
+    except InvalidCursor:
+        raise Http404("Curseur invalide")
+
+@login_required
+def conversation_detail(request, pk):
+    """Détail d'une conversation avec la dernière fenêtre de messages"""
+    conversation = _get_participant_conversation(request, pk)
     
     if request.method == 'POST':
         form = MessageForm(request.POST)
         if form.is_valid():
-            message = form.save(commit=False)
-            message.conversation = conversation
-            message.sender = request.user
-            message.save()
-            
-            # Mettre à jour la conversation
-            conversation.last_message_at = timezone.now()
-            conversation.save()
+            # Créer le message (met à jour la conversation et les non lus)
+            conversation.add_message(request.user, form.cleaned_data['content'])
             
             return redirect('conversation_detail', pk=conversation.pk)
     else:
         form = MessageForm()
     
+    page = _message_page(conversation)
+    messages_list = list(reversed(page.object_list))
+    
+    # Accusé de lecture : avancer le repère du lecteur (aucune mise à jour des messages)
+    if messages_list:
+        conversation.mark_read(request.user, messages_list[-1].id)
+    
     # Déterminer l'autre participant
     other_user = conversation.seller if request.user == conversation.buyer else conversation.buyer
     
     context = {
         'conversation': conversation,
         'messages': messages_list,
+        'older_cursor': page.next_cursor,
+        'other_last_read_message_id': conversation.get_last_read_message_id(other_user),
         'form': form,
         'other_user': other_user,
     }
     
     return render(request, 'listings/conversation_detail.html', context)
 
+@login_required
+def conversation_messages(request, pk):
+    """Messages plus anciens d'une conversation (AJAX, « charger plus »)"""
+    conversation = _get_participant_conversation(request, pk)
+    page = _message_page(conversation, request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'messages': [
+            {
+                'id': message.id,
+                'sender': message.sender.username,
+                'content': message.content,
+                'created_at': message.created_at.isoformat(),
+            }
+            for message in reversed(page.object_list)
+        ],
+        'older_cursor': page.next_cursor,
+    })
+
 def register(request):
     """Inscription d'un nouvel utilisateur"""
     if request.method == 'POST':
@@ -50,6 +50,7 @@ CREATE TABLE category (
   image VARCHAR(200),
   is_active BOOLEAN NOT NULL DEFAULT TRUE,
   depth INTEGER NOT NULL DEFAULT 1,
+  path VARCHAR(255) NOT NULL DEFAULT '',  -- Chemin matérialisé des ids (ex: 1/5/12/)
   listing_count INTEGER NOT NULL DEFAULT 0,
   sort_order INTEGER NOT NULL DEFAULT 0,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
@@ -145,6 +146,10 @@ CREATE TABLE conversation (
   seller_id BIGINT NOT NULL,
   last_message_at TIMESTAMPTZ,
   is_active BOOLEAN NOT NULL DEFAULT TRUE,
+  buyer_unread_count INTEGER NOT NULL DEFAULT 0,   -- Non lus dénormalisés (boîte de réception)
+  seller_unread_count INTEGER NOT NULL DEFAULT 0,
+  buyer_last_read_message_id BIGINT,              -- Accusés de lecture (repère par participant)
+  seller_last_read_message_id BIGINT,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
   CONSTRAINT fk_conversation_listing FOREIGN KEY (listing_id) REFERENCES listing(id) ON DELETE CASCADE,
   UNIQUE (listing_id, buyer_id, seller_id)
@@ -194,6 +199,7 @@ CREATE INDEX idx_category_parent ON category(parent_id);
 CREATE INDEX idx_category_slug ON category(slug);
 CREATE INDEX idx_category_kind ON category(kind);
 CREATE INDEX idx_category_active ON category(is_active);
+CREATE INDEX idx_category_path ON category(path varchar_pattern_ops);  -- Sous-arbres par préfixe
 
 -- Annonces (INDEX CRITIQUES)
 CREATE INDEX idx_listing_user ON listing(user_id);
@@ -205,6 +211,14 @@ CREATE INDEX idx_listing_created ON listing(created_at DESC);
 CREATE INDEX idx_listing_featured ON listing(featured_until) WHERE featured_until IS NOT NULL;
 CREATE INDEX idx_listing_slug ON listing(slug);
 
+-- Pagination par curseur (statut, clé de tri, id)
+CREATE INDEX idx_listing_keyset_created ON listing(status, created_at, id);
+CREATE INDEX idx_listing_keyset_price ON listing(status, price_cents, id);
+CREATE INDEX idx_listing_keyset_views ON listing(status, view_count, id);
+CREATE INDEX idx_listing_keyset_title ON listing(status, title, id);
+CREATE INDEX idx_listing_keyset_category ON listing(category_id, status, created_at, id);
+CREATE INDEX idx_listing_keyset_user ON listing(user_id, created_at, id);
+
 -- Index pour recherche full-text (CRITIQUE)
 CREATE INDEX idx_listing_search_gin ON listing USING GIN (search_vector);
 
@@ -212,9 +226,11 @@ CREATE INDEX idx_listing_search_gin ON listing USING GIN (search_vector);
 CREATE INDEX idx_listing_image_listing ON listing_image(listing_id);
 CREATE INDEX idx_listing_image_primary ON listing_image(listing_id, is_primary);
 CREATE INDEX idx_favorite_user ON user_favorite(user_id);
+CREATE INDEX idx_favorite_keyset_user ON user_favorite(user_id, created_at, id);
 CREATE INDEX idx_favorite_listing ON user_favorite(listing_id);
 CREATE INDEX idx_conversation_listing ON conversation(listing_id);
 CREATE INDEX idx_message_conversation ON message(conversation_id);
+CREATE INDEX idx_message_conv_created ON message(conversation_id, created_at);
 
 -- =========================
 -- ÉTAPE 4: Fonctions PostgreSQL spécialisées (ON GARDE)
@@ -286,20 +302,94 @@ LANGUAGE sql STABLE AS $$
   LIMIT limit_count OFFSET offset_count;
 $$;
 
+-- Document full-text d'une annonce (partagé par le trigger et les mises à jour en masse)
+CREATE OR REPLACE FUNCTION listing_search_document(
+  title_param TEXT,
+  description_param TEXT,
+  category_name_param TEXT,
+  location_param TEXT
+)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+  -- Le nom de catégorie est indexé pour remplacer le filtre category__name__icontains
+  -- 'french' : même configuration que listings/search.py (SEARCH_LANGUAGE)
+  SELECT
+    setweight(to_tsvector('french', coalesce(title_param,'')), 'A') ||
+    setweight(to_tsvector('french', coalesce(description_param,'')), 'B') ||
+    setweight(to_tsvector('french', coalesce(category_name_param,'')), 'C') ||
+    setweight(to_tsvector('french', coalesce(location_param,'')), 'C');
+$$;
+
 -- Fonction pour mettre à jour le search_vector (SERA APPELÉE PAR DJANGO)
 CREATE OR REPLACE FUNCTION update_listing_search_vector(listing_id_param BIGINT)
 RETURNS VOID
 LANGUAGE plpgsql AS $$
 BEGIN
-  UPDATE listing 
-  SET search_vector = 
-    setweight(to_tsvector('french', coalesce(title,'')), 'A') ||
-    setweight(to_tsvector('french', coalesce(description,'')), 'B') ||
-    setweight(to_tsvector('french', coalesce(location,'')), 'C')
-  WHERE id = listing_id_param;
+  UPDATE listing l
+  SET search_vector = listing_search_document(l.title, l.description, c.name, l.location)
+  FROM category c
+  WHERE l.id = listing_id_param
+    AND c.id = l.category_id;
 END;
 $$;
 
+-- Reconstruction ensembliste des vecteurs sur une plage d'ids (commande update_search_vectors)
+CREATE OR REPLACE FUNCTION refresh_listing_search_vectors(min_id_param BIGINT, max_id_param BIGINT)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  updated_count INTEGER;
+BEGIN
+  UPDATE listing l
+  SET search_vector = listing_search_document(l.title, l.description, c.name, l.location)
+  FROM category c
+  WHERE l.id > min_id_param
+    AND l.id <= max_id_param
+    AND c.id = l.category_id;
+  GET DIAGNOSTICS updated_count = ROW_COUNT;
+  RETURN updated_count;
+END;
+$$;
+
+-- Mise à jour incrémentale : le vecteur est recalculé à chaque écriture pertinente
+CREATE OR REPLACE FUNCTION trg_listing_search_vector()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.search_vector := listing_search_document(
+    NEW.title,
+    NEW.description,
+    (SELECT name FROM category WHERE id = NEW.category_id),
+    NEW.location
+  );
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS listing_search_vector_update ON listing;
+CREATE TRIGGER listing_search_vector_update
+  BEFORE INSERT OR UPDATE OF title, description, location, category_id ON listing
+  FOR EACH ROW EXECUTE FUNCTION trg_listing_search_vector();
+
+-- Renommage d'une catégorie : recalcul ensembliste des annonces concernées
+CREATE OR REPLACE FUNCTION trg_category_name_search_vector()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  UPDATE listing
+  SET search_vector = listing_search_document(title, description, NEW.name, location)
+  WHERE category_id = NEW.id;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS category_name_search_vector_update ON category;
+CREATE TRIGGER category_name_search_vector_update
+  AFTER UPDATE OF name ON category
+  FOR EACH ROW
+  WHEN (OLD.name IS DISTINCT FROM NEW.name)
+  EXECUTE FUNCTION trg_category_name_search_vector();
+
 -- Vue optimisée pour les annonces actives
 CREATE OR REPLACE VIEW active_listings AS
 SELECT 
@@ -332,6 +422,60 @@ WHERE l.status = 'active'
 -- ÉTAPE 5: Fonctions utilitaires Django peut utiliser
 -- =========================
 
+-- Recalcul complet des chemins matérialisés et profondeurs (après import SQL)
+CREATE OR REPLACE FUNCTION rebuild_category_paths()
+RETURNS VOID
+LANGUAGE sql AS $$
+  WITH RECURSIVE tree AS (
+    SELECT id, id::TEXT || '/' AS path, 1 AS depth
+    FROM category
+    WHERE parent_id IS NULL
+    UNION ALL
+    SELECT c.id, t.path || c.id::TEXT || '/', t.depth + 1
+    FROM category c
+    JOIN tree t ON c.parent_id = t.id
+  )
+  UPDATE category c
+  SET path = tree.path, depth = tree.depth
+  FROM tree
+  WHERE c.id = tree.id;
+$$;
+
+-- Remplissage des chemins des catégories existantes
+SELECT rebuild_category_paths();
+
+-- Recalcul des non lus dénormalisés : messages de l'autre participant,
+-- non marqués lus et postérieurs à son repère de lecture
+CREATE OR REPLACE FUNCTION recount_conversation_unread()
+RETURNS INTEGER
+LANGUAGE sql AS $$
+  WITH counts AS (
+    SELECT c.id,
+      count(m.id) FILTER (
+        WHERE m.sender_id = c.seller_id AND m.id > coalesce(c.buyer_last_read_message_id, 0)
+      ) AS buyer_unread,
+      count(m.id) FILTER (
+        WHERE m.sender_id = c.buyer_id AND m.id > coalesce(c.seller_last_read_message_id, 0)
+      ) AS seller_unread
+    FROM conversation c
+    LEFT JOIN message m ON m.conversation_id = c.id AND m.read_at IS NULL
+    GROUP BY c.id
+  ), updated AS (
+    UPDATE conversation c
+    SET buyer_unread_count = counts.buyer_unread,
+        seller_unread_count = counts.seller_unread
+    FROM counts
+    WHERE c.id = counts.id
+      AND (c.buyer_unread_count, c.seller_unread_count)
+          IS DISTINCT FROM (counts.buyer_unread::INTEGER, counts.seller_unread::INTEGER)
+    RETURNING 1
+  )
+  SELECT count(*)::INTEGER FROM updated;
+$$;
+
+-- Remplissage des non lus des conversations existantes
+SELECT recount_conversation_unread();
+
 -- Fonction pour calculer les statistiques d'une catégorie
 CREATE OR REPLACE FUNCTION get_category_stats(category_id_param BIGINT)
 RETURNS TABLE(
@@ -350,4 +494,50 @@ LANGUAGE sql STABLE AS $$
     MAX(l.price_cents) as max_price
   FROM listing l
   WHERE l.category_id = category_id_param;
-$$;
\ No newline at end of file
+$$;
+
+-- Statistiques matérialisées par catégorie (lecture O(1) sur les pages catégorie)
+CREATE TABLE IF NOT EXISTS category_stats (
+  category_id BIGINT PRIMARY KEY,
+  total_listings BIGINT NOT NULL DEFAULT 0,
+  active_listings BIGINT NOT NULL DEFAULT 0,
+  avg_price DECIMAL,
+  min_price BIGINT,
+  max_price BIGINT,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  CONSTRAINT fk_category_stats_category FOREIGN KEY (category_id) REFERENCES category(id) ON DELETE CASCADE
+);
+
+-- Recalcul ensembliste (une catégorie, ou toutes si NULL) en un seul GROUP BY
+CREATE OR REPLACE FUNCTION refresh_category_stats(category_id_param BIGINT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  refreshed_count INTEGER;
+BEGIN
+  INSERT INTO category_stats (
+    category_id, total_listings, active_listings, avg_price, min_price, max_price, refreshed_at
+  )
+  SELECT
+    c.id,
+    COUNT(l.id),
+    COUNT(l.id) FILTER (WHERE l.status = 'active'),
+    ROUND(AVG(l.price_cents)::DECIMAL / 100, 2),
+    MIN(l.price_cents),
+    MAX(l.price_cents),
+    now()
+  FROM category c
+  LEFT JOIN listing l ON l.category_id = c.id
+  WHERE category_id_param IS NULL OR c.id = category_id_param
+  GROUP BY c.id
+  ON CONFLICT (category_id) DO UPDATE SET
+    total_listings = EXCLUDED.total_listings,
+    active_listings = EXCLUDED.active_listings,
+    avg_price = EXCLUDED.avg_price,
+    min_price = EXCLUDED.min_price,
+    max_price = EXCLUDED.max_price,
+    refreshed_at = EXCLUDED.refreshed_at;
+  GET DIAGNOSTICS refreshed_count = ROW_COUNT;
+  RETURN refreshed_count;
+END;
+$$;
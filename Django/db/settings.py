@@ -58,6 +58,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
+                'listings.category_tree.category_menu',
             ],
         },
     },
@@ -152,8 +153,8 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 IMAGE_UPLOAD_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
 
-# Configuration pour la recherche full-text PostgreSQL
-SEARCH_LANGUAGE = 'french'
+# Recherche full-text PostgreSQL : configuration 'french' fixée dans
+# listing_search_document() (schema_hybride.sql) et listings/search.py
 
 # Configuration de cache (optionnel)
 CACHES = {
@@ -163,6 +164,16 @@ CACHES = {
     }
 }
 
+# Durées de cache des blocs de la page d'accueil (secondes)
+HOME_CACHE_TIMEOUTS = {
+    'stats': 300,
+    'categories': 3600,
+    'listings': 600,
+}
+
+# Fraîcheur maximale des statistiques de catégorie (secondes)
+CATEGORY_STATS_MAX_AGE = 900
+
 # Configuration pour les sessions
 SESSION_COOKIE_AGE = 1209600  # 2 semaines
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
@@ -244,6 +255,8 @@ SITE_KEYWORDS = "petites annonces, Guinée, achat, vente, location"
 
 # Pagination
 PAGINATE_BY = 20
+MESSAGES_PAGE_SIZE = 30  # Messages chargés par fenêtre dans une conversation
+PAGINATION_COUNT_CACHE_TIMEOUT = 300  # Durée de cache des totaux (secondes)
 
 # Configuration des devises supportées
 SUPPORTED_CURRENCIES = [
@@ -264,10 +277,16 @@ THUMBNAIL_SIZES = {
     'medium': (300, 300),
     'large': (800, 600),
 }
+THUMBNAIL_ASYNC = True  # Génération en arrière-plan après l'upload
+THUMBNAIL_WORKERS = 2  # Threads de génération par processus
 
 # Configuration pour les annonces
 LISTING_EXPIRY_DAYS = 90  # Expiration automatique après 90 jours
 MAX_IMAGES_PER_LISTING = 10
+
+# Compteur de vues : vidage par lots (perte maximale bornée par ces deux valeurs)
+VIEW_COUNT_FLUSH_INTERVAL = 10  # secondes
+VIEW_COUNT_MAX_PENDING = 500  # vues en attente par processus
 FEATURED_LISTING_DURATION_DAYS = 30
 
 # Configuration des notifications
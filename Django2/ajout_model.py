@@ -2,6 +2,8 @@
 # models.py (ajouts)
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
 # Modèles existants + ajouts :
@@ -15,8 +17,26 @@ class ProfilUtilisateur(models.Model):
     description = models.TextField(blank=True)
     date_creation = models.DateTimeField(auto_now_add=True)
     
+    # Évaluations reçues (dénormalisées, maintenues par les signaux Evaluation)
+    note_moyenne = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    nb_evaluations = models.PositiveIntegerField(default=0)
+    
     def __str__(self):
         return f"Profil de {self.user.username}"
+    
+    @classmethod
+    def recalculer_evaluations(cls, user_ids=None):
+        """Recalculer note moyenne et nombre d'évaluations en une seule requête UPDATE"""
+        from .models import Evaluation
+        evaluations = Evaluation.objects.filter(evalue=OuterRef('user_id')).values('evalue')
+        profils = cls.objects.all() if user_ids is None else cls.objects.filter(user_id__in=user_ids)
+        return profils.update(
+            note_moyenne=Subquery(evaluations.annotate(moyenne=Avg('note')).values('moyenne')),
+            nb_evaluations=Coalesce(
+                Subquery(evaluations.annotate(nombre=Count('id')).values('nombre')),
+                0
+            )
+        )
 
 class Conversation(models.Model):
     annonce = models.ForeignKey(Annonce, on_delete=models.CASCADE, related_name='conversations')
@@ -40,6 +60,10 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['date_envoi']
+        indexes = [
+            # Dernier message d'une conversation (boîte de réception)
+            models.Index(fields=['conversation', 'date_envoi'], name='idx_message_conv_date'),
+        ]
     
     def __str__(self):
         return f"Message de {self.expediteur.username}"
@@ -52,7 +76,8 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, Count, F, OuterRef, Subquery
 from .models import *
 from .forms import *
 
@@ -80,13 +105,15 @@ def creer_annonce(request):
         photos_form = PhotoAnnonceFormSet(request.POST, request.FILES)
         
         if form.is_valid() and photos_form.is_valid():
-            annonce = form.save(commit=False)
-            annonce.vendeur = request.user
-            annonce.save()
-            
-            # Sauvegarder les photos
-            photos_form.instance = annonce
-            photos_form.save()
+            # Les photos sont traitées par Celery après le commit de l'annonce
+            with transaction.atomic():
+                annonce = form.save(commit=False)
+                annonce.vendeur = request.user
+                annonce.save()
+                
+                # Sauvegarder les photos (fichiers temporaires déplacés, pas recopiés)
+                photos_form.instance = annonce
+                photos_form.save()
             
             messages.success(request, 'Votre annonce a été créée avec succès!')
             return redirect('annonces:detail', pk=annonce.pk)
@@ -110,8 +137,9 @@ def modifier_annonce(request, pk):
         photos_form = PhotoAnnonceFormSet(request.POST, request.FILES, instance=annonce)
         
         if form.is_valid() and photos_form.is_valid():
-            form.save()
-            photos_form.save()
+            with transaction.atomic():
+                form.save()
+                photos_form.save()
             messages.success(request, 'Votre annonce a été modifiée avec succès!')
             return redirect('annonces:detail', pk=annonce.pk)
     else:
@@ -245,11 +273,18 @@ def conversation_view(request, pk):
     if request.method == 'POST':
         contenu = request.POST.get('message')
         if contenu:
-            Message.objects.create(
+            message = Message.objects.create(
                 conversation=conversation,
                 expediteur=request.user,
                 contenu=contenu
             )
+            # Envoi AJAX : le destinataire reçoit le message par WebSocket
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'id': message.id,
+                    'contenu': message.contenu,
+                    'date_envoi': message.date_envoi.isoformat(),
+                })
             return redirect('annonces:conversation', pk=pk)
     
     messages_list = conversation.messages.all()
@@ -262,15 +297,22 @@ def conversation_view(request, pk):
 
 @login_required
 def mes_messages(request):
+    # Dernier message (sous-requête) et non lus annotés : une seule requête
+    dernier_message = Message.objects.filter(
+        conversation=OuterRef('pk')
+    ).order_by('-date_envoi', '-id')
     conversations = Conversation.objects.filter(
         Q(acheteur=request.user) | Q(vendeur=request.user),
         active=True
-    ).select_related('annonce', 'acheteur', 'vendeur').prefetch_related('messages')
-    
-    # Ajouter le dernier message à chaque conversation
-    for conv in conversations:
-        conv.dernier_message = conv.messages.last()
-        conv.nb_non_lus = conv.messages.filter(lu=False).exclude(expediteur=request.user).count()
+    ).select_related('annonce', 'acheteur', 'vendeur').annotate(
+        dernier_message_contenu=Subquery(dernier_message.values('contenu')[:1]),
+        dernier_message_date=Subquery(dernier_message.values('date_envoi')[:1]),
+        dernier_message_expediteur=Subquery(dernier_message.values('expediteur__username')[:1]),
+        nb_non_lus=Count(
+            'messages',
+            filter=Q(messages__lu=False) & ~Q(messages__expediteur=request.user)
+        ),
+    ).order_by(F('dernier_message_date').desc(nulls_last=True))
     
     context = {
         'conversations': conversations
@@ -279,7 +321,10 @@ def mes_messages(request):
 
 # forms.py (ajouts)
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.forms import modelformset_factory, inlineformset_factory
+from PIL import Image
 from .models import *
 
 class AnnonceForm(forms.ModelForm):
@@ -314,7 +359,82 @@ class AnnonceForm(forms.ModelForm):
             'urgent': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+# Signatures des formats acceptés (premiers octets du fichier)
+SIGNATURES_IMAGES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+
+def format_par_signature(entete):
+    if entete[:4] == b'RIFF' and entete[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, format_image in SIGNATURES_IMAGES:
+        if entete.startswith(signature):
+            return format_image
+    return None
+
+class ImageEnFluxField(forms.FileField):
+    """Image validée sur son en-tête, sans décodage complet
+    
+    Le fichier reste sur disque (TemporaryFileUploadHandler) : seuls la
+    signature et les dimensions déclarées sont lues.
+    """
+    default_error_messages = {
+        'invalid_image': "Envoyez une image JPEG, PNG, WebP ou GIF valide.",
+        'trop_lourde': "L'image dépasse %(max)s Mo.",
+        'trop_grande': "L'image dépasse %(max)s mégapixels.",
+    }
+    
+    def to_python(self, data):
+        fichier = super().to_python(data)
+        if fichier is None:
+            return None
+        
+        taille_max = getattr(settings, 'PHOTO_TAILLE_MAX', 10 * 1024 * 1024)
+        if fichier.size > taille_max:
+            raise ValidationError(
+                self.error_messages['trop_lourde'],
+                code='trop_lourde',
+                params={'max': taille_max // (1024 * 1024)}
+            )
+        
+        fichier.seek(0)
+        format_image = format_par_signature(fichier.read(16))
+        fichier.seek(0)
+        if format_image is None:
+            raise ValidationError(self.error_messages['invalid_image'], code='invalid_image')
+        
+        try:
+            # Image.open ne lit que l'en-tête : aucun pixel n'est décodé ici
+            with Image.open(fichier) as image:
+                largeur, hauteur = image.size
+                if image.format != format_image:
+                    raise ValidationError(self.error_messages['invalid_image'], code='invalid_image')
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.error_messages['invalid_image'], code='invalid_image')
+        finally:
+            fichier.seek(0)
+        
+        pixels_max = getattr(settings, 'PHOTO_MEGAPIXELS_MAX', 40)
+        if largeur * hauteur > pixels_max * 1000 * 1000:
+            raise ValidationError(
+                self.error_messages['trop_grande'],
+                code='trop_grande',
+                params={'max': pixels_max}
+            )
+        fichier.content_type = Image.MIME[format_image]
+        return fichier
+    
+    def widget_attrs(self, widget):
+        attrs = super().widget_attrs(widget)
+        attrs.setdefault('accept', 'image/*')
+        return attrs
+
 class PhotoAnnonceForm(forms.ModelForm):
+    image = ImageEnFluxField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    
     class Meta:
         model = PhotoAnnonce
         fields = ['image', 'ordre']
@@ -426,10 +546,13 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ['contenu', 'expediteur__username']
 
 # signals.py (création automatique du profil)
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import ProfilUtilisateur
+from .models import ProfilUtilisateur, Message, Evaluation, PhotoAnnonce
+from .utils import diffuser_message
+from .tasks import traiter_photo_annonce
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -441,6 +564,25 @@ def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profil'):
         instance.profil.save()
 
+@receiver(post_save, sender=Evaluation)
+@receiver(post_delete, sender=Evaluation)
+def maj_note_vendeur(sender, instance, **kwargs):
+    ProfilUtilisateur.recalculer_evaluations([instance.evalue_id])
+
+@receiver(post_save, sender=PhotoAnnonce)
+def planifier_traitement_photo(sender, instance, created, **kwargs):
+    # Hors de la requête : le worker Celery normalise l'original et produit les dérivés
+    # (nouvelle photo ou image remplacée)
+    if instance.image and (created or instance.image_modifiee()):
+        transaction.on_commit(lambda: traiter_photo_annonce.delay(instance.pk))
+    instance._image_chargee = instance.image.name
+
+@receiver(post_save, sender=Message)
+def diffuser_nouveau_message(sender, instance, created, **kwargs):
+    # Après le commit : le destinataire ne reçoit jamais un message annulé
+    if created:
+        transaction.on_commit(lambda: diffuser_message(instance))
+
 # apps.py (pour activer les signals)
 from django.apps import AppConfig
 
@@ -451,6 +593,19 @@ class AnnoncesConfig(AppConfig):
     def ready(self):
         import annonces.signals
 
+# management/commands/recalculer_notes_vendeurs.py
+from django.core.management.base import BaseCommand
+from annonces.models import Evaluation, ProfilUtilisateur
+
+class Command(BaseCommand):
+    help = 'Recalcule note moyenne et nombre d\'évaluations des vendeurs déjà évalués (à lancer après déploiement)'
+
+    def handle(self, *args, **options):
+        # Les profils sans évaluation gardent leurs valeurs par défaut (NULL, 0)
+        vendeurs = Evaluation.objects.values('evalue_id').distinct()
+        total = ProfilUtilisateur.recalculer_evaluations(vendeurs)
+        self.stdout.write(self.style.SUCCESS(f'{total} profils de vendeurs mis à jour'))
+
 # settings.py (ajouts)
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -460,6 +615,12 @@ LOGOUT_REDIRECT_URL = '/'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Pour dev
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # Pour prod
 
-# Taille max des fichiers (10MB)
+# Uploads écrits sur disque par blocs (jamais gardés en mémoire)
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
-DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
\ No newline at end of file
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Photos d'annonces
+PHOTO_TAILLE_MAX = 10 * 1024 * 1024  # Taille max d'un fichier
+PHOTO_MEGAPIXELS_MAX = 40  # Dimensions max déclarées dans l'en-tête
+PHOTO_LARGEUR_MAX = 1600  # Largeur de l'original après traitement
\ No newline at end of file
@@ -166,6 +166,8 @@ http {
 }
 
 # tests/test_models.py
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -258,6 +260,28 @@ class FavoriModelTest(TestCase):
         with self.assertRaises(Exception):
             Favori.objects.create(utilisateur=self.user, annonce=self.annonce)
 
+class RecalculNotesVendeursTest(TestCase):
+    def test_commande_remplit_les_profils_existants(self):
+        """Les évaluations antérieures au champ dénormalisé sont prises en compte"""
+        vendeur = User.objects.create_user(username='vendeur', password='test')
+        annonce = Annonce.objects.create(
+            titre='Test', description='Test', prix=100,
+            categorie=Categorie.objects.create(nom='Test', emoji='🧪'),
+            vendeur=vendeur, ville='Paris'
+        )
+        for i, note in enumerate([3, 5]):
+            Evaluation.objects.create(
+                evaluateur=User.objects.create_user(username=f'acheteur{i}', password='test'),
+                evalue=vendeur, annonce=annonce, note=note
+            )
+        # État d'un profil créé avant la dénormalisation
+        ProfilUtilisateur.objects.filter(user=vendeur).update(note_moyenne=None, nb_evaluations=0)
+        
+        call_command('recalculer_notes_vendeurs', stdout=StringIO())
+        
+        profil = ProfilUtilisateur.objects.get(user=vendeur)
+        self.assertEqual((profil.note_moyenne, profil.nb_evaluations), (4, 2))
+
 # tests/test_views.py
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
@@ -403,6 +427,102 @@ class AnnonceAPITest(APITestCase):
         response = self.client.post('/api/annonces/', data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_curseur_departage_les_dates_identiques(self):
+        """Pages par curseur sans doublon ni oubli quand les dates sont égales"""
+        for i in range(5):
+            Annonce.objects.create(
+                titre=f'Annonce {i}', description='Test', prix=100,
+                categorie=self.categorie, vendeur=self.user, ville='Paris'
+            )
+        Annonce.objects.update(date_creation=Annonce.objects.first().date_creation)
+        
+        ids = []
+        url, params = '/api/annonces/', {'cursor': '', 'page_size': 2}
+        while url:
+            page = self.client.get(url, params).json()
+            ids += [annonce['id'] for annonce in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(ids, sorted(Annonce.objects.values_list('id', flat=True), reverse=True))
+
+    def test_tri_distance_sans_coordonnees_refuse(self):
+        """tri=distance sans latitude/longitude est rejeté plutôt qu'ignoré"""
+        response = self.client.get('/api/annonces/recherche/', {'tri': 'distance', 'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+# tests/test_api_requetes.py
+import json
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+from annonces.models import *
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+class AnnonceListeRequetesTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # Les fichiers n'existent pas : pas de génération de dérivés en file pendant le test
+        patcher = mock.patch('annonces.miniatures.planifier_miniatures')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.categorie = Categorie.objects.create(nom='Test', emoji='🧪')
+        for i in range(30):
+            vendeur = User.objects.create_user(username=f'vendeur{i}', password='test')
+            Evaluation.objects.create(
+                evaluateur=vendeur,
+                evalue=vendeur,
+                annonce=Annonce.objects.create(
+                    titre=f'Annonce {i}',
+                    description='Description longue ' * 100,
+                    prix=100,
+                    categorie=self.categorie,
+                    vendeur=vendeur,
+                    ville='Paris'
+                ),
+                note=4
+            )
+        for annonce in Annonce.objects.all():
+            for ordre in range(3):
+                PhotoAnnonce.objects.create(
+                    annonce=annonce,
+                    image=f'annonces/photos/{annonce.pk}_{ordre}.jpg',
+                    ordre=ordre
+                )
+
+    def nombre_requetes(self, page_size):
+        cache.clear()
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get('/api/annonces/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        return len(requetes)
+
+    def test_requetes_constantes_par_page(self):
+        """Le nombre de requêtes ne dépend pas de la taille de la page"""
+        self.assertEqual(self.nombre_requetes(5), self.nombre_requetes(30))
+        self.assertLessEqual(self.nombre_requetes(30), 2)  # COUNT + page
+
+    def test_miniatures_en_un_aller_retour_de_cache(self):
+        """Les miniatures d'une page sont lues en un seul get_many, pas un par carte"""
+        with mock.patch('annonces.miniatures.cache.get_many', wraps=cache.get_many) as get_many:
+            response = self.client.get('/api/annonces/', {'page_size': 20})
+        self.assertEqual(len(response.json()['results']), 20)
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_taille_liste_contre_detail(self):
+        """Un élément de liste est bien plus léger que le détail"""
+        liste = self.client.get('/api/annonces/', {'page_size': 1})
+        element = liste.json()['results'][0]
+        detail = self.client.get(f"/api/annonces/{element['id']}/")
+        
+        self.assertLess(len(json.dumps(element)) * 3, len(detail.content))
+        self.assertEqual(element['vendeur']['nb_evaluations'], 1)
+        self.assertTrue(element['photo_principale'].endswith('_0.jpg'))
+        self.assertLessEqual(len(element['extrait']), 200)
+
 # tests/test_performance.py
 from django.test import TestCase
 from django.test.utils import override_settings
@@ -457,14 +577,665 @@ class PerformanceTest(TestCase):
         # Le deuxième appel devrait être plus rapide
         self.assertLess(second_call_time, first_call_time)
 
+# tests/test_consumers.py
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from annonces.models import *
+from channels.db import database_sync_to_async
+from annonces.consumers import NotificationConsumer
+
+@override_settings(CHANNEL_LAYERS={
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+})
+class MessagerieTempsReelTest(TransactionTestCase):
+    def setUp(self):
+        self.vendeur = User.objects.create_user(username='vendeur', password='test')
+        self.acheteur = User.objects.create_user(username='acheteur', password='test')
+        categorie = Categorie.objects.create(nom='Test', emoji='🧪')
+        annonce = Annonce.objects.create(
+            titre='Test',
+            description='Test',
+            prix=100,
+            categorie=categorie,
+            vendeur=self.vendeur,
+            ville='Paris'
+        )
+        self.conversation = Conversation.objects.create(
+            annonce=annonce,
+            acheteur=self.acheteur,
+            vendeur=self.vendeur
+        )
+
+    async def connecter(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_nouveau_message_pousse_au_destinataire(self):
+        """Le signal post_save pousse le nouveau message une seule fois à l'autre participant"""
+        async def scenario():
+            vendeur = await self.connecter(self.vendeur)
+            await database_sync_to_async(Message.objects.create)(
+                conversation=self.conversation,
+                expediteur=self.acheteur,
+                contenu='Bonjour'
+            )
+            event = await vendeur.receive_json_from()
+            self.assertEqual(event['type'], 'message')
+            self.assertEqual(event['data']['contenu'], 'Bonjour')
+            self.assertTrue(await vendeur.receive_nothing())
+            await vendeur.disconnect()
+        async_to_sync(scenario)()
+
+    def test_frappe_et_lecture(self):
+        """Les événements de frappe et de lecture transitent par le socket"""
+        message = Message.objects.create(
+            conversation=self.conversation,
+            expediteur=self.acheteur,
+            contenu='Bonjour'
+        )
+
+        async def scenario():
+            acheteur = await self.connecter(self.acheteur)
+            vendeur = await self.connecter(self.vendeur)
+            
+            await acheteur.send_json_to({'type': 'typing', 'conversation_id': self.conversation.pk})
+            event = await vendeur.receive_json_from()
+            self.assertEqual(event['type'], 'typing')
+            
+            await vendeur.send_json_to({
+                'type': 'read',
+                'conversation_id': self.conversation.pk,
+                'message_id': message.pk
+            })
+            event = await acheteur.receive_json_from()
+            self.assertEqual(event['type'], 'read')
+            self.assertEqual(event['data']['message_id'], message.pk)
+            
+            await acheteur.disconnect()
+            await vendeur.disconnect()
+        async_to_sync(scenario)()
+        
+        message.refresh_from_db()
+        self.assertTrue(message.lu)
+
+    def test_evenement_hors_conversation_ignore(self):
+        """Un non-participant ne peut rien émettre dans la conversation"""
+        intrus = User.objects.create_user(username='intrus', password='test')
+
+        async def scenario():
+            vendeur = await self.connecter(self.vendeur)
+            autre = await self.connecter(intrus)
+            await autre.send_json_to({'type': 'typing', 'conversation_id': self.conversation.pk})
+            self.assertTrue(await vendeur.receive_nothing())
+            await autre.disconnect()
+            await vendeur.disconnect()
+        async_to_sync(scenario)()
+
+# tests/test_notifications.py
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+from celery.exceptions import Retry
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from annonces.models import *
+from annonces.notifications import envoyer_digests
+from annonces.tasks import (
+    EMAILS_PAR_CONNEXION, envoyer_alerte_nouvelles_annonces, envoyer_digests_alertes
+)
+
+class ConnexionCoupee(locmem.EmailBackend):
+    """Backend locmem dont la connexion tombe après `apres` emails"""
+    def __init__(self, apres, **kwargs):
+        super().__init__(**kwargs)
+        self.apres = apres
+
+    def send_messages(self, messages):
+        if len(mail.outbox) >= self.apres:
+            raise SMTPException('coupure')
+        return super().send_messages(messages)
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EnvoiAlertesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='acheteur',
+            email='acheteur@example.com',
+            password='test'
+        )
+        self.categorie = Categorie.objects.create(nom='Sport', emoji='🚲')
+        for nom, mots_cles in [('Vélos', 'vélo'), ('Rouge', 'rouge')]:
+            Alerte.objects.create(utilisateur=self.user, nom_alerte=nom, mots_cles=mots_cles)
+        Annonce.objects.create(
+            titre='Vélo rouge',
+            description='Vélo de course',
+            prix=100,
+            categorie=self.categorie,
+            vendeur=User.objects.create_user(username='vendeur', password='test'),
+            ville='Paris'
+        )
+
+    @mock.patch('annonces.tasks.envoyer_digests_alertes.delay')
+    def test_notifications_et_digest_par_utilisateur(self, delay):
+        """Une notification par alerte, un seul email par utilisateur"""
+        envoyer_alerte_nouvelles_annonces()
+        
+        self.assertEqual(Notification.objects.filter(utilisateur=self.user).count(), 2)
+        digests = delay.call_args[0][0]
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(len(digests[0]['alertes']), 2)
+        self.assertFalse(
+            Alerte.objects.filter(derniere_verification__isnull=True).exists()
+        )
+
+    @mock.patch('annonces.tasks.envoyer_digests_alertes.delay')
+    def test_fenetre_bornee_et_premier_envoi_limite(self, delay):
+        """Les annonces hors fenêtre sont ignorées ; une nouvelle alerte reçoit au plus 5 annonces"""
+        vendeur = User.objects.get(username='vendeur')
+        for i in range(7):
+            Annonce.objects.create(
+                titre=f'Vélo {i}', description='Occasion', prix=50,
+                categorie=self.categorie, vendeur=vendeur, ville='Paris'
+            )
+        Annonce.objects.filter(titre='Vélo rouge').update(
+            date_creation=timezone.now() - timedelta(days=2)
+        )
+        
+        correspondances = envoyer_alerte_nouvelles_annonces()
+        
+        self.assertEqual(correspondances, 1)  # « Rouge » ne voit plus l'annonce ancienne
+        notification = Notification.objects.get(utilisateur=self.user)
+        self.assertIn('5 nouvelle(s)', notification.message)
+
+    @override_settings(ALERTES_EMAILS_PAR_SECONDE=100)
+    def test_envoi_digests_locmem(self):
+        """Les digests partent sur la connexion fournie"""
+        digests = [
+            {'email': f'user{i}@example.com', 'alertes': [['Vélos', 1]]}
+            for i in range(3)
+        ]
+        self.assertEqual(envoyer_digests(digests), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('Vélos', mail.outbox[0].body)
+
+    @override_settings(ALERTES_EMAILS_PAR_SECONDE=10)
+    def test_echec_au_milieu_d_un_lot(self):
+        """Une coupure SMTP au 3e email d'un lot : seuls les digests non remis sont relancés"""
+        digests = [
+            {'email': f'user{i}@example.com', 'alertes': [['Vélos', 1]]}
+            for i in range(5)
+        ]
+        with mock.patch('annonces.notifications.get_connection', return_value=ConnexionCoupee(apres=2)), \
+                mock.patch.object(envoyer_digests_alertes, 'retry', side_effect=Retry) as retry:
+            with self.assertRaises(Retry):
+                envoyer_digests_alertes(digests)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(retry.call_args.kwargs['args'], [digests[2:]])
+        self.assertEqual(retry.call_args.kwargs['exc'].envoyes, 2)
+
+    @override_settings(ALERTES_EMAILS_PAR_SECONDE=100)
+    def test_reprise_apres_echec_partiel(self):
+        """Après un échec en cours de connexion, seuls les digests non remis sont relancés"""
+        digests = [
+            {'email': f'user{i}@example.com', 'alertes': [['Vélos', 1]]}
+            for i in range(EMAILS_PAR_CONNEXION + 20)
+        ]
+        coupure = SMTPException('coupure')
+        coupure.envoyes = 10
+        envoi = mock.Mock(side_effect=[EMAILS_PAR_CONNEXION, coupure])
+        with mock.patch('annonces.tasks.envoyer_digests', envoi), \
+                mock.patch.object(envoyer_digests_alertes, 'retry', side_effect=Retry) as retry:
+            with self.assertRaises(Retry):
+                envoyer_digests_alertes(digests)
+        self.assertEqual(retry.call_args.kwargs['args'], [digests[EMAILS_PAR_CONNEXION + 10:]])
+
+# tests/test_vues.py
+from unittest import mock
+import fakeredis
+from django.contrib.auth.models import User
+from django.test import TestCase
+from annonces import vues
+from annonces.models import *
+
+HEURE = 500000
+
+@mock.patch('annonces.vues._heure_courante', return_value=HEURE)
+class VuesTranchesHorairesTest(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('annonces.vues.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enregistrer_vue_dans_la_tranche_courante(self, _):
+        """Chaque vue incrémente l'heure courante, avec expiration et suivi de l'annonce"""
+        vues.enregistrer_vue(7)
+        vues.enregistrer_vue(7)
+        self.assertEqual(self.redis.hgetall('vues:7'), {str(HEURE).encode(): b'2'})
+        self.assertGreater(self.redis.ttl('vues:7'), vues.HEURES_CONSERVEES * 3600)
+        self.assertEqual(self.redis.smembers(vues.ANNONCES_VUES_KEY), {b'7'})
+
+    def test_fenetres_jour_et_semaine(self, _):
+        """24 h et 7 jours glissants ; les tranches plus anciennes sont purgées"""
+        self.redis.hset('vues:7', mapping={
+            HEURE: 3, HEURE - 23: 2, HEURE - 24: 10, HEURE - vues.HEURES_CONSERVEES + 1: 1,
+            HEURE - vues.HEURES_CONSERVEES: 100,
+        })
+        self.assertEqual(vues.fenetres_vues([7, 8]), {7: (5, 16), 8: (0, 0)})
+        self.assertFalse(self.redis.hexists('vues:7', HEURE - vues.HEURES_CONSERVEES))
+        
+        tendance = vues.tendance_vues(7, heures=24)
+        self.assertEqual(len(tendance), 24)
+        self.assertEqual((tendance[0], tendance[-1]), (2, 3))
+
+    def test_incrementer_vues_alimente_les_tranches(self, _):
+        """Annonce.incrementer_vues met à jour la base et la tranche Redis"""
+        annonce = Annonce.objects.create(
+            titre='Vélo', description='Test', prix=100,
+            categorie=Categorie.objects.create(nom='Sport', emoji='🚲'),
+            vendeur=User.objects.create_user(username='vendeur', password='test'),
+            ville='Paris'
+        )
+        annonce.incrementer_vues()
+        annonce.refresh_from_db()
+        self.assertEqual(annonce.vues_count, 1)
+        self.assertEqual(vues.fenetres_vues([annonce.pk]), {annonce.pk: (1, 1)})
+
+# tests/test_miniatures.py
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from annonces import miniatures
+from annonces.models import *
+from annonces.tasks import generer_miniatures_fichier
+
+TAILLES = {'small': (150, 150), 'medium': (300, 300), 'large': (800, 600)}
+
+@override_settings(
+    THUMBNAIL_SIZES=TAILLES,
+    PHOTO_LARGEUR_MAX=1000,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class MiniaturesTest(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        reglage = override_settings(MEDIA_ROOT=media)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+        cache.clear()
+        self.nom = self.enregistrer_image('annonces/photos/velo.jpg', (1200, 900))
+
+    def enregistrer_image(self, nom, dimensions, mode='RGB', format_='JPEG'):
+        buffer = BytesIO()
+        Image.new(mode, dimensions, 'red').save(buffer, format_)
+        return default_storage.save(nom, ContentFile(buffer.getvalue()))
+
+    def test_generer_miniatures(self):
+        """Chaque taille en JPEG et WebP, bornée par THUMBNAIL_SIZES et mise en cache"""
+        generees = miniatures.generer_miniatures(self.nom)
+        self.assertEqual(set(generees), {(taille, webp) for taille in TAILLES for webp in (False, True)})
+        for (taille, webp), derive in generees.items():
+            with default_storage.open(derive, 'rb') as fichier, Image.open(fichier) as image:
+                self.assertEqual(image.format, 'WEBP' if webp else 'JPEG')
+                self.assertLessEqual(image.width, TAILLES[taille][0])
+                self.assertLessEqual(image.height, TAILLES[taille][1])
+            self.assertEqual(cache.get(miniatures._cle_cache(self.nom, taille, webp)), derive)
+
+    def test_generer_miniatures_png_avec_transparence(self):
+        """Une image transparente garde son canal alpha (PNG, pas JPEG)"""
+        nom = self.enregistrer_image('annonces/photos/logo.png', (400, 400), 'RGBA', 'PNG')
+        generees = miniatures.generer_miniatures(nom, ['small'])
+        self.assertTrue(generees[('small', False)].endswith('_small.png'))
+
+    @mock.patch('annonces.tasks.generer_miniatures_fichier.delay')
+    def test_original_servi_et_generation_en_file_une_fois(self, delay):
+        """Dérivé manquant : URL de l'original, une seule mise en file"""
+        original = default_storage.url(self.nom)
+        self.assertEqual(miniatures.url_miniature(self.nom, 'small'), original)
+        self.assertEqual(miniatures.url_miniature(self.nom, 'small', webp=True), original)
+        delay.assert_called_once_with(self.nom)
+        self.assertFalse(default_storage.exists(miniatures.nom_miniature(self.nom, 'small')))
+
+    @mock.patch('annonces.tasks.generer_miniatures_fichier.delay')
+    def test_derive_existant_sans_cache(self, delay):
+        """Un dérivé présent sur le disque est servi et remis en cache, sans génération"""
+        miniatures.generer_miniatures(self.nom)
+        cache.clear()
+        self.assertEqual(
+            miniatures.url_miniature(self.nom, 'medium'),
+            default_storage.url(miniatures.nom_miniature(self.nom, 'medium'))
+        )
+        self.assertIsNotNone(cache.get(miniatures._cle_cache(self.nom, 'medium', False)))
+        delay.assert_not_called()
+
+    def test_taille_inconnue(self):
+        self.assertEqual(miniatures.url_miniature(self.nom, 'geante'), default_storage.url(self.nom))
+        self.assertIsNone(miniatures.url_miniature('', 'small'))
+
+    def test_tache_normalise_puis_genere(self):
+        """generer_miniatures_fichier borne l'original puis produit tous les dérivés"""
+        self.assertEqual(generer_miniatures_fichier.apply(args=[self.nom]).get(), len(TAILLES) * 2)
+        with default_storage.open(self.nom, 'rb') as fichier, Image.open(fichier) as image:
+            self.assertEqual(image.size, (1000, 750))
+        self.assertTrue(default_storage.exists(miniatures.nom_miniature(self.nom, 'large', webp=True)))
+
+    def test_normaliser_original_garde_le_webp_sans_perte(self):
+        """Un WebP sans perte redimensionné reste sans perte, un PNG reste PNG"""
+        buffer = BytesIO()
+        Image.new('RGBA', (1200, 600), (255, 0, 0, 128)).save(buffer, 'WEBP', lossless=True)
+        webp = default_storage.save('annonces/photos/plan.webp', ContentFile(buffer.getvalue()))
+        png = self.enregistrer_image('annonces/photos/logo.png', (1200, 600), 'RGBA', 'PNG')
+        
+        self.assertTrue(miniatures.normaliser_original(webp))
+        self.assertTrue(miniatures.normaliser_original(png))
+        with default_storage.open(webp, 'rb') as fichier:
+            self.assertTrue(miniatures._webp_sans_perte(fichier.read()))
+        with default_storage.open(png, 'rb') as fichier, Image.open(fichier) as image:
+            self.assertEqual((image.format, image.mode, image.width), ('PNG', 'RGBA', 1000))
+
+    def test_normaliser_original_ignore_les_animations(self):
+        """Un GIF animé n'est pas réécrit : il perdrait toutes ses frames sauf la première"""
+        buffer = BytesIO()
+        frames = [Image.new('RGB', (1200, 600), couleur) for couleur in ('red', 'blue')]
+        frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:])
+        nom = default_storage.save('annonces/photos/anim.gif', ContentFile(buffer.getvalue()))
+        
+        self.assertFalse(miniatures.normaliser_original(nom))
+        with default_storage.open(nom, 'rb') as fichier:
+            self.assertEqual(fichier.read(), buffer.getvalue())
+
+    @mock.patch('annonces.signals.traiter_photo_annonce.delay')
+    def test_traitement_planifie_si_l_image_change(self, delay):
+        """Création ou remplacement de l'image : traitement ; autre modification : rien"""
+        annonce = Annonce.objects.create(
+            titre='Vélo', description='Test', prix=100,
+            categorie=Categorie.objects.create(nom='Sport', emoji='🚲'),
+            vendeur=User.objects.create_user(username='vendeur', password='test'),
+            ville='Paris'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = PhotoAnnonce.objects.create(annonce=annonce, image=self.nom)
+        photo = PhotoAnnonce.objects.get(pk=photo.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.ordre = 2
+            photo.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.image = self.enregistrer_image('annonces/photos/autre.jpg', (400, 300))
+            photo.save()
+        self.assertEqual(delay.call_args_list, [mock.call(photo.pk)] * 2)
+
+    def test_filtres_de_gabarit(self):
+        miniatures.generer_miniatures(self.nom)
+        rendu = Template(
+            '{% load annonce_miniatures %}{{ nom|miniature:"small" }} {{ nom|miniature_webp }}'
+        ).render(Context({'nom': self.nom}))
+        self.assertEqual(rendu, '{} {}'.format(
+            default_storage.url(miniatures.nom_miniature(self.nom, 'small')),
+            default_storage.url(miniatures.nom_miniature(self.nom, 'medium', webp=True)),
+        ))
+
+    def test_precharger_miniatures_en_un_aller_retour(self):
+        """Toutes les cartes d'une liste en une requête SQL et un seul get_many"""
+        miniatures.generer_miniatures(self.nom)
+        categorie = Categorie.objects.create(nom='Sport', emoji='🚲')
+        vendeur = User.objects.create_user(username='vendeur', password='test')
+        annonces = [
+            Annonce.objects.create(
+                titre=f'Vélo {i}', description='Test', prix=100,
+                categorie=categorie, vendeur=vendeur, ville='Paris'
+            )
+            for i in range(5)
+        ]
+        for annonce in annonces[:4]:
+            PhotoAnnonce.objects.create(annonce=annonce, image=self.nom, ordre=1)
+        PhotoAnnonce.objects.create(annonce=annonces[0], image='annonces/photos/autre.jpg', ordre=2)
+        
+        gabarit = Template(
+            '{% load annonce_miniatures %}'
+            '{% precharger_miniatures annonces "small" as page %}'
+            '{% for annonce in page %}{{ annonce.miniatures.small.jpg|default:"-" }},{% endfor %}'
+        )
+        with mock.patch('annonces.miniatures.cache.get_many', wraps=cache.get_many) as get_many, \
+                self.assertNumQueries(1):
+            rendu = gabarit.render(Context({'annonces': annonces}))
+        self.assertEqual(get_many.call_count, 1)
+        petite = default_storage.url(miniatures.nom_miniature(self.nom, 'small'))
+        self.assertEqual(rendu, f'{petite},' * 4 + '-,')
+
+# tests/test_geocodage.py
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from annonces import geocodage
+from annonces.models import CacheGeocodage
+
+class BackendEnPanne:
+    nom = 'panne'
+
+    def geocoder(self, cle):
+        raise TimeoutError(cle)
+
+class BackendVide:
+    nom = 'vide'
+
+    def geocoder(self, cle):
+        return None
+
+class GeocodageEchecsTest(TestCase):
+    def setUp(self):
+        geocodage._geocoder_cle.cache_clear()
+        self.addCleanup(geocodage._geocoder_cle.cache_clear)
+
+    def test_echec_de_backend_non_memorise(self):
+        """Un backend en erreur ne laisse aucun échec en base ni dans le LRU"""
+        with mock.patch.object(geocodage, 'get_backends', return_value=[BackendEnPanne()]):
+            self.assertIsNone(geocodage.geocoder('Conakry'))
+            self.assertEqual(geocodage.geocoder_lot(['Kindia']), {'Kindia': None})
+        self.assertFalse(CacheGeocodage.objects.exists())
+        
+        with mock.patch.object(geocodage, 'get_backends', return_value=[geocodage.GazetteerLocal()]):
+            self.assertIsNotNone(geocodage.geocoder('Conakry'))
+            self.assertIsNotNone(geocodage.geocoder_lot(['Kindia'])['Kindia'])
+
+    def test_echec_confirme_puis_expire(self):
+        """Un échec confirmé par tous les backends est mémorisé, puis retenté après le TTL"""
+        backend = mock.Mock(wraps=BackendVide(), nom='vide')
+        with mock.patch.object(geocodage, 'get_backends', return_value=[backend]):
+            geocodage.geocoder('Nulle Part')
+            geocodage.geocoder('Nulle Part')
+            self.assertEqual(backend.geocoder.call_count, 1)
+            
+            CacheGeocodage.objects.update(date_creation=timezone.now() - timedelta(days=30))
+            geocodage.geocoder_lot(['Nulle Part'])
+            self.assertEqual(backend.geocoder.call_count, 2)
+        self.assertEqual(CacheGeocodage.objects.count(), 1)
+
+# tests/test_distances.py
+import random
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from annonces import geocodage
+from annonces.alertes import annonces_du_lot, faire_correspondre
+from annonces.models import *
+from annonces.utils import haversine_km, plus_proches
+
+class PlusProchesTest(SimpleTestCase):
+    def setUp(self):
+        alea = random.Random(42)
+        self.origine = (9.5, -13.7)
+        self.points = [(alea.uniform(7, 13), alea.uniform(-15, -8)) for _ in range(200)]
+        self.reference = sorted(
+            (haversine_km(*self.origine, lat, lng), i) for i, (lat, lng) in enumerate(self.points)
+        )
+
+    def test_k_plus_proches_comme_haversine(self):
+        """Les k premiers et leurs distances sont ceux de haversine_km"""
+        indices, distances = plus_proches(self.origine, self.points, k=10)
+        self.assertEqual(list(indices), [i for _, i in self.reference[:10]])
+        for distance, (attendue, _) in zip(distances, self.reference):
+            self.assertAlmostEqual(distance, attendue, places=6)
+
+    def test_k_superieur_au_nombre_de_points(self):
+        """k > n renvoie tous les points, triés"""
+        indices, distances = plus_proches(self.origine, self.points[:5], k=50)
+        attendus = sorted(range(5), key=lambda i: haversine_km(*self.origine, *self.points[i]))
+        self.assertEqual(list(indices), attendus)
+        self.assertEqual(list(distances), sorted(distances))
+
+    def test_filtre_par_rayon(self):
+        """Seuls les points à moins de rayon_km sont gardés, puis k s'applique"""
+        indices, distances = plus_proches(self.origine, self.points, rayon_km=150)
+        self.assertEqual(list(indices), [i for d, i in self.reference if d <= 150])
+        self.assertTrue(all(d <= 150 for d in distances))
+        
+        indices, _ = plus_proches(self.origine, self.points, k=3, rayon_km=150)
+        self.assertEqual(list(indices), [i for d, i in self.reference if d <= 150][:3])
+        
+        indices, distances = plus_proches(self.origine, self.points, rayon_km=0.001)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(distances), 0)
+
+@override_settings(GEOCODAGE_BACKENDS=['annonces.geocodage.GazetteerLocal'])
+class AlerteRayonTest(TestCase):
+    def setUp(self):
+        geocodage.get_backends.cache_clear()
+        self.addCleanup(geocodage.get_backends.cache_clear)
+        utilisateur = User.objects.create_user(username='acheteur', password='test')
+        self.annonce = Annonce.objects.create(
+            titre='Moto Yamaha', description='Bon état', prix=500,
+            categorie=Categorie.objects.create(nom='Véhicules', emoji='🏍️'),
+            vendeur=User.objects.create_user(username='vendeur', password='test'),
+            ville='Kindia'
+        )
+        Localisation.objects.create(annonce=self.annonce, latitude=10.0569, longitude=-12.8658)
+        for rayon in (50, 150):
+            Alerte.objects.create(
+                utilisateur=utilisateur, nom_alerte=f'{rayon} km', mots_cles='moto',
+                ville='Conakry', rayon_km=rayon
+            )
+
+    def test_rayon_de_l_alerte(self):
+        """Kindia (~110 km de Conakry) n'entre que dans l'alerte de 150 km"""
+        annonces = annonces_du_lot(self.annonce.date_creation - timedelta(seconds=1), timezone.now())
+        correspondances = faire_correspondre(annonces)
+        self.assertEqual([alerte.nom_alerte for alerte in correspondances], ['150 km'])
+        self.assertEqual(list(correspondances.values()), [[self.annonce.pk]])
+
 # management/commands/optimiser_images.py
 from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import Max, Min
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
+from annonces.miniatures import FORMATS_REENREGISTRABLES, enregistrer_meme_format
+import django
+import hashlib
 import os
-from annonces.models import PhotoAnnonce
+import tempfile
+import time
+
+# À incrémenter quand l'algorithme change : les images déjà traitées seront reprises
+VERSION_OPTIMISATION = 1
+
+def _empreinte(contenu):
+    return hashlib.sha256(contenu).hexdigest()
+
+def _initialiser_processus():
+    # Processus lancés par spawn (Windows, macOS) : Django n'y est pas encore configuré
+    django.setup()
+
+def optimiser_fichier(chemin, quality, max_width):
+    """Optimise un fichier sans changer son format ; renvoie (contenu final, octets gagnés)
+
+    Le JPEG est recompressé ; PNG (transparence comprise) et WebP sans perte
+    restent sans perte. L'écriture passe par un fichier temporaire renommé
+    atomiquement : un arrêt brutal ne laisse jamais d'image tronquée.
+    """
+    with open(chemin, 'rb') as f:
+        original = f.read()
+    
+    with Image.open(chemin) as img:
+        format_origine = img.format
+        if format_origine not in FORMATS_REENREGISTRABLES or getattr(img, 'is_animated', False):
+            return original, 0
+        if img.width > max_width:
+            img = img.resize(
+                (max_width, int(img.height * max_width / img.width)),
+                Image.Resampling.LANCZOS
+            )
+        
+        fd, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as sortie:
+                enregistrer_meme_format(img, sortie, format_origine, original, quality)
+            taille = os.path.getsize(temporaire)
+            if taille >= len(original):
+                # Pas de gain : on garde l'original
+                os.unlink(temporaire)
+                return original, 0
+            os.replace(temporaire, chemin)
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.unlink(temporaire)
+            raise
+    
+    with open(chemin, 'rb') as f:
+        contenu = f.read()
+    return contenu, len(original) - len(contenu)
+
+def optimiser_lot(debut, fin, quality, max_width, force):
+    """Traite les photos d'ids [debut, fin) dans un processus du pool"""
+    from annonces.models import PhotoAnnonce
+    resultats = {'maj': [], 'octets_gagnes': 0, 'traitees': 0, 'ignorees': 0, 'erreurs': []}
+    photos = PhotoAnnonce.objects.filter(id__gte=debut, id__lt=fin).exclude(image='').values_list(
+        'id', 'image', 'empreinte', 'version_optimisation'
+    )
+    for photo_id, nom, empreinte, version in photos:
+        try:
+            chemin = default_storage.path(nom)
+            if not os.path.exists(chemin):
+                continue
+            with open(chemin, 'rb') as f:
+                actuelle = _empreinte(f.read())
+            # Fichier inchangé depuis la dernière optimisation avec cette version
+            if not force and empreinte == actuelle and version >= VERSION_OPTIMISATION:
+                resultats['ignorees'] += 1
+                continue
+            contenu, gain = optimiser_fichier(chemin, quality, max_width)
+            resultats['maj'].append((photo_id, _empreinte(contenu)))
+            resultats['octets_gagnes'] += gain
+            resultats['traitees'] += 1
+        except Exception as e:
+            resultats['erreurs'].append(f'{nom}: {e}')
+    connections.close_all()
+    return resultats
 
 class Command(BaseCommand):
-    help = 'Optimise les images existantes'
+    help = 'Optimise les images existantes (en parallèle, reprend là où le dernier passage s\'est arrêté)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -479,41 +1250,70 @@ class Command(BaseCommand):
             default=1200,
             help='Largeur maximale'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Nombre de processus'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Plage d\'ids traitée par tâche'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Retraiter aussi les images déjà optimisées'
+        )
 
     def handle(self, *args, **options):
-        photos = PhotoAnnonce.objects.all()
-        optimized_count = 0
-
-        for photo in photos:
-            try:
-                if photo.image and os.path.exists(photo.image.path):
-                    with Image.open(photo.image.path) as img:
-                        # Convertir en RGB si nécessaire
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            img = img.convert('RGB')
-                        
-                        # Redimensionner si nécessaire
-                        if img.width > options['max_width']:
-                            ratio = options['max_width'] / img.width
-                            new_height = int(img.height * ratio)
-                            img = img.resize((options['max_width'], new_height), Image.Resampling.LANCZOS)
-                        
-                        # Sauvegarder avec compression
-                        img.save(
-                            photo.image.path,
-                            'JPEG',
-                            quality=options['quality'],
-                            optimize=True
-                        )
-                        optimized_count += 1
-
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Erreur avec {photo.image.name}: {e}')
+        # Import différé : le module est réimporté par les processus avant django.setup()
+        from annonces.models import PhotoAnnonce
+        bornes = PhotoAnnonce.objects.aggregate(min_id=Min('id'), max_id=Max('id'))
+        if bornes['min_id'] is None:
+            self.stdout.write(self.style.SUCCESS('Aucune image à optimiser'))
+            return
+        
+        pas = options['chunk_size']
+        plages = [
+            (debut, debut + pas)
+            for debut in range(bornes['min_id'], bornes['max_id'] + 1, pas)
+        ]
+        traitees = ignorees = octets_gagnes = 0
+        depart = time.monotonic()
+        
+        # Les processus fils ouvrent leurs propres connexions
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_initialiser_processus) as pool:
+            futures = [
+                pool.submit(optimiser_lot, debut, fin, options['quality'], options['max_width'], options['force'])
+                for debut, fin in plages
+            ]
+            for future in as_completed(futures):
+                resultats = future.result()
+                # Enregistrer chaque lot terminé : un passage interrompu reprend ici
+                PhotoAnnonce.objects.bulk_update(
+                    [
+                        PhotoAnnonce(id=photo_id, empreinte=empreinte, version_optimisation=VERSION_OPTIMISATION)
+                        for photo_id, empreinte in resultats['maj']
+                    ],
+                    ['empreinte', 'version_optimisation']
                 )
-
+                traitees += resultats['traitees']
+                ignorees += resultats['ignorees']
+                octets_gagnes += resultats['octets_gagnes']
+                for erreur in resultats['erreurs']:
+                    self.stdout.write(self.style.ERROR(f'Erreur avec {erreur}'))
+        
+        duree = time.monotonic() - depart
         self.stdout.write(
-            self.style.SUCCESS(f'{optimized_count} images optimisées')
+            self.style.SUCCESS(
+                f'{traitees} images optimisées, {ignorees} inchangées ignorées, '
+                f'{octets_gagnes / 1024 / 1024:.1f} Mo gagnés '
+                f'({traitees / duree if duree else 0:.1f} images/s)'
+            )
         )
 
 # settings/production.py
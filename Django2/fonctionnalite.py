@@ -8,12 +8,15 @@ django-filter>=23.0
 channels>=4.0.0
 channels-redis>=4.1.0
 redis>=4.5.0
+django-redis>=5.3.0
 celery>=5.3.0
 django-extensions>=3.2.0
 django-debug-toolbar>=4.1.0
 gunicorn>=21.0.0
 whitenoise>=6.5.0
 psycopg2-binary>=2.9.0
+numpy>=1.24.0
+fakeredis>=2.20.0  # tests
 """
 
 # models.py (ajouts pour fonctionnalités avancées)
@@ -70,6 +73,12 @@ class Localisation(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     adresse_complete = models.CharField(max_length=300, blank=True)
     
+    class Meta:
+        indexes = [
+            # Préfiltre des recherches par rayon (boîte englobante)
+            models.Index(fields=['latitude', 'longitude'], name='idx_localisation_lat_lng'),
+        ]
+    
     def __str__(self):
         return f"Localisation de {self.annonce.titre}"
     
@@ -79,6 +88,27 @@ class Localisation(models.Model):
             return Point(float(self.longitude), float(self.latitude))
         return None
 
+class CacheGeocodage(models.Model):
+    """Résultats de géocodage par adresse normalisée (y compris les échecs)"""
+    adresse_normalisee = models.CharField(max_length=300, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    adresse_complete = models.CharField(max_length=300, blank=True)
+    source = models.CharField(max_length=50, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.adresse_normalisee
+    
+    def resultat(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return {
+            'latitude': float(self.latitude),
+            'longitude': float(self.longitude),
+            'adresse_complete': self.adresse_complete
+        }
+
 class Statistique(models.Model):
     annonce = models.OneToOneField(Annonce, on_delete=models.CASCADE, related_name='statistiques')
     vues_aujourd_hui = models.PositiveIntegerField(default=0)
@@ -109,6 +139,11 @@ class Alerte(models.Model):
 # api/serializers.py (pour l'API REST)
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Substr
+from django.utils.text import Truncator
+from ..utils import distances_km, haversine_km
+from ..miniatures import url_miniature, urls_miniatures_lot
 from ..models import *
 
 class CategorieSerializer(serializers.ModelSerializer):
@@ -116,10 +151,38 @@ class CategorieSerializer(serializers.ModelSerializer):
         model = Categorie
         fields = '__all__'
 
+class PhotoAnnonceListeSerializer(serializers.ListSerializer):
+    """Résout les miniatures de toutes les photos en un aller-retour de cache"""
+    
+    def to_representation(self, data):
+        photos = list(data.all() if hasattr(data, 'all') else data)
+        urls = urls_miniatures_lot(photo.image.name for photo in photos if photo.image)
+        for photo in photos:
+            if photo.image:
+                photo.urls_miniatures = urls[photo.image.name]
+        return super().to_representation(photos)
+
 class PhotoAnnonceSerializer(serializers.ModelSerializer):
+    miniatures = serializers.SerializerMethodField()
+    
     class Meta:
         model = PhotoAnnonce
-        fields = ['id', 'image', 'ordre']
+        fields = ['id', 'image', 'ordre', 'miniatures']
+        list_serializer_class = PhotoAnnonceListeSerializer
+    
+    def get_miniatures(self, obj):
+        """{taille: {'jpg': url, 'webp': url}} pour chaque taille de THUMBNAIL_SIZES"""
+        request = self.context.get('request')
+        absolue = request.build_absolute_uri if request else (lambda url: url)
+        if not obj.image:
+            return {}
+        urls = getattr(obj, 'urls_miniatures', None)
+        if urls is None:
+            urls = urls_miniatures_lot([obj.image.name])[obj.image.name]
+        return {
+            taille: {format_: absolue(url) for format_, url in variantes.items()}
+            for taille, variantes in urls.items()
+        }
 
 class VendeurSerializer(serializers.ModelSerializer):
     note_moyenne = serializers.SerializerMethodField()
@@ -129,14 +192,16 @@ class VendeurSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'date_joined', 'note_moyenne', 'nb_evaluations']
     
+    # Lus sur le profil (select_related('vendeur__profil')) : aucune requête par vendeur
     def get_note_moyenne(self, obj):
-        evaluations = obj.evaluations_recues.all()
-        if evaluations:
-            return sum(e.note for e in evaluations) / len(evaluations)
+        profil = getattr(obj, 'profil', None)
+        if profil and profil.note_moyenne is not None:
+            return float(profil.note_moyenne)
         return None
     
     def get_nb_evaluations(self, obj):
-        return obj.evaluations_recues.count()
+        profil = getattr(obj, 'profil', None)
+        return profil.nb_evaluations if profil else 0
 
 class AnnonceSerializer(serializers.ModelSerializer):
     categorie = CategorieSerializer(read_only=True)
@@ -149,12 +214,108 @@ class AnnonceSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_distance(self, obj):
-        # Calculer la distance si coordonnées utilisateur fournies
+        # Distance annotée par la recherche par rayon, sinon calculée depuis ?latitude=&longitude=
+        distance = getattr(obj, 'distance_km', None)
+        if distance is None:
+            request = self.context.get('request')
+            localisation = getattr(obj, 'localisation', None)
+            if not request or not localisation or localisation.latitude is None or localisation.longitude is None:
+                return None
+            try:
+                lat = float(request.query_params['latitude'])
+                lng = float(request.query_params['longitude'])
+            except (KeyError, ValueError):
+                return None
+            distance = haversine_km(lat, lng, localisation.latitude, localisation.longitude)
+        return round(distance, 1)
+
+class AnnonceListeDistanceSerializer(serializers.ListSerializer):
+    """Calcule en un seul appel NumPy les distances de toute la page
+    
+    Les miniatures des photos principales sont résolues de même, en un seul
+    aller-retour de cache pour la page.
+    """
+    
+    def to_representation(self, data):
+        annonces = list(data.all() if hasattr(data, 'all') else data)
+        noms = [getattr(annonce, 'photo_principale_image', None) for annonce in annonces]
+        urls = urls_miniatures_lot(noms, ['medium'])
+        for annonce, nom in zip(annonces, noms):
+            if nom:
+                annonce.url_photo_principale = urls[nom]['medium']['jpg']
         request = self.context.get('request')
-        if request and hasattr(request, 'user_location') and hasattr(obj, 'localisation'):
-            # Logique de calcul de distance
+        origine = None
+        if request:
+            try:
+                origine = (float(request.query_params['latitude']), float(request.query_params['longitude']))
+            except (KeyError, ValueError):
+                pass
+        if origine:
+            a_calculer = [
+                annonce for annonce in annonces
+                if getattr(annonce, 'distance_km', None) is None
+                and getattr(annonce, 'loc_latitude', None) is not None
+                and getattr(annonce, 'loc_longitude', None) is not None
+            ]
+            if a_calculer:
+                distances = distances_km(
+                    origine,
+                    [(annonce.loc_latitude, annonce.loc_longitude) for annonce in a_calculer]
+                )
+                for annonce, distance in zip(a_calculer, distances):
+                    annonce.distance_km = float(distance)
+        return super().to_representation(annonces)
+
+class AnnonceListSerializer(serializers.ModelSerializer):
+    """Annonce allégée pour les listes : photo principale, extrait, distance précalculée"""
+    TAILLE_EXTRAIT = 200
+    
+    categorie = serializers.CharField(source='categorie.nom', read_only=True)
+    vendeur = VendeurSerializer(read_only=True)
+    extrait = serializers.SerializerMethodField()
+    photo_principale = serializers.SerializerMethodField()
+    distance = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Annonce
+        fields = [
+            'id', 'titre', 'extrait', 'prix', 'categorie', 'etat', 'ville',
+            'code_postal', 'urgent', 'vues_count', 'date_creation',
+            'photo_principale', 'vendeur', 'distance',
+        ]
+        list_serializer_class = AnnonceListeDistanceSerializer
+    
+    @classmethod
+    def preparer_queryset(cls, queryset):
+        """Plan de chargement : une seule requête par page, quel que soit le nombre d'annonces"""
+        photo = PhotoAnnonce.objects.filter(
+            annonce=OuterRef('pk')
+        ).order_by('ordre', 'id').values('image')[:1]
+        return queryset.select_related('categorie', 'vendeur__profil').defer(
+            'description'
+        ).annotate(
+            extrait_description=Substr('description', 1, cls.TAILLE_EXTRAIT + 1),
+            photo_principale_image=Subquery(photo),
+            # Coordonnées pour le calcul groupé des distances (LEFT JOIN, pas de requête en plus)
+            loc_latitude=F('localisation__latitude'),
+            loc_longitude=F('localisation__longitude'),
+        )
+    
+    def get_extrait(self, obj):
+        return Truncator(obj.extrait_description or '').chars(self.TAILLE_EXTRAIT)
+    
+    def get_photo_principale(self, obj):
+        # Miniature « medium » des cartes de liste, pas l'original
+        if not obj.photo_principale_image:
             return None
-        return None
+        url = getattr(obj, 'url_photo_principale', None) or url_miniature(obj.photo_principale_image, 'medium')
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+    
+    def get_distance(self, obj):
+        # Annotée par la recherche géographique (en km), sinon absente
+        distance = getattr(obj, 'distance_km', None)
+        return round(distance, 1) if distance is not None else None
 
 class AnnonceCreateSerializer(serializers.ModelSerializer):
     photos = serializers.ListField(
@@ -207,16 +368,64 @@ class NotificationSerializer(serializers.ModelSerializer):
 from rest_framework import generics, permissions, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.db.models import Q, Avg, Count
+from django.utils.functional import cached_property
+import hashlib
 from .serializers import *
+from ..utils import filtrer_par_rayon
+
+class CachedCountPaginator(Paginator):
+    """Paginator dont le COUNT(*) est mis en cache (total approximatif)"""
+    
+    @cached_property
+    def count(self):
+        sql, params = self.object_list.query.sql_with_params()
+        key = 'count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        return cache.get_or_set(key, self.object_list.count, 300)
 
 class AnnoncePagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class AnnonceCursorPagination(CursorPagination):
+    """Pagination par curseur (ni OFFSET ni COUNT), départagée par l'id"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-date_creation', '-id')
+    
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('tri') == 'distance' and 'distance_km' in queryset.query.annotations:
+            # Tri de la recherche par rayon (sinon remplacé par le tri par défaut)
+            return ('distance_km', 'id')
+        # OrderingFilter impose le tri de la vue ou de ?ordering= : on y ajoute l'id
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(champ.lstrip('-') in ('id', 'pk') for champ in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+class CursorPaginationMixin:
+    """Bascule sur la pagination par curseur quand ?cursor= est présent"""
+    cursor_pagination_class = AnnonceCursorPagination
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = self.cursor_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
 class AnnonceFilter(filters.FilterSet):
     prix_min = filters.NumberFilter(field_name='prix', lookup_expr='gte')
     prix_max = filters.NumberFilter(field_name='prix', lookup_expr='lte')
@@ -231,8 +440,8 @@ class AnnonceFilter(filters.FilterSet):
             Q(titre__icontains=value) | Q(description__icontains=value)
         )
 
-class AnnonceListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Annonce.objects.filter(active=True).select_related('categorie', 'vendeur')
+class AnnonceListCreateAPIView(CursorPaginationMixin, generics.ListCreateAPIView):
+    queryset = Annonce.objects.filter(active=True).select_related('categorie', 'vendeur__profil')
     pagination_class = AnnoncePagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = AnnonceFilter
@@ -240,10 +449,16 @@ class AnnonceListCreateAPIView(generics.ListCreateAPIView):
     ordering_fields = ['prix', 'date_creation', 'vues_count']
     ordering = ['-date_creation']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET':
+            queryset = AnnonceListSerializer.preparer_queryset(queryset)
+        return queryset
+    
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return AnnonceCreateSerializer
-        return AnnonceSerializer
+        return AnnonceListSerializer
     
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -254,7 +469,9 @@ class AnnonceListCreateAPIView(generics.ListCreateAPIView):
         serializer.save(vendeur=self.request.user)
 
 class AnnonceDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Annonce.objects.filter(active=True)
+    queryset = Annonce.objects.filter(active=True).select_related(
+        'categorie', 'vendeur__profil'
+    ).prefetch_related('photos')
     serializer_class = AnnonceSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     
@@ -301,13 +518,15 @@ def toggle_favori_api(request, annonce_id):
     except Annonce.DoesNotExist:
         return Response({'error': 'Annonce non trouvée'}, status=404)
 
-class MesAnnoncesAPIView(generics.ListAPIView):
-    serializer_class = AnnonceSerializer
+class MesAnnoncesAPIView(CursorPaginationMixin, generics.ListAPIView):
+    serializer_class = AnnonceListSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = AnnoncePagination
     
     def get_queryset(self):
-        return Annonce.objects.filter(vendeur=self.request.user).order_by('-date_creation')
+        return AnnonceListSerializer.preparer_queryset(
+            Annonce.objects.filter(vendeur=self.request.user)
+        ).order_by('-date_creation')
 
 class NotificationListAPIView(generics.ListAPIView):
     serializer_class = NotificationSerializer
@@ -330,12 +549,12 @@ def marquer_notification_lue(request, notification_id):
     except Notification.DoesNotExist:
         return Response({'error': 'Notification non trouvée'}, status=404)
 
-class RechercheAvanceeAPIView(generics.ListAPIView):
-    serializer_class = AnnonceSerializer
+class RechercheAvanceeAPIView(CursorPaginationMixin, generics.ListAPIView):
+    serializer_class = AnnonceListSerializer
     pagination_class = AnnoncePagination
     
     def get_queryset(self):
-        queryset = Annonce.objects.filter(active=True)
+        queryset = AnnonceListSerializer.preparer_queryset(Annonce.objects.filter(active=True))
         
         # Filtres géographiques
         lat = self.request.query_params.get('latitude')
@@ -343,82 +562,605 @@ class RechercheAvanceeAPIView(generics.ListAPIView):
         rayon = self.request.query_params.get('rayon', 10)  # km
         
         if lat and lng:
-            # Filtrer par rayon géographique
-            # Implémentation avec PostGIS ou calcul de distance
-            pass
+            try:
+                lat, lng, rayon = float(lat), float(lng), float(rayon)
+            except ValueError:
+                raise ValidationError("latitude, longitude et rayon doivent être numériques.")
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180 and rayon > 0):
+                raise ValidationError("Coordonnées ou rayon hors limites.")
+            # Boîte englobante indexée puis distance haversine exacte
+            queryset = filtrer_par_rayon(queryset, lat, lng, rayon)
+            if self.request.query_params.get('tri') == 'distance':
+                queryset = queryset.order_by('distance_km', 'id')
+        elif self.request.query_params.get('tri') == 'distance':
+            raise ValidationError("Le tri par distance nécessite latitude et longitude.")
         
         # Filtres avancés
         note_min = self.request.query_params.get('note_vendeur_min')
         if note_min:
-            queryset = queryset.annotate(
-                note_moyenne=Avg('vendeur__evaluations_recues__note')
-            ).filter(note_moyenne__gte=note_min)
+            queryset = queryset.filter(vendeur__profil__note_moyenne__gte=note_min)
         
         return queryset
 
+# alertes.py (Correspondance ensembliste des alertes de recherche)
+import re
+import unicodedata
+from collections import defaultdict
+from django.db.models import F
+from .geocodage import geocoder_lot
+from .models import Alerte, Annonce
+from .utils import plus_proches
+
+ALERTES_PAR_LOT = 20000
+
+def _normaliser(texte):
+    """Minuscules sans accents"""
+    texte = unicodedata.normalize('NFKD', (texte or '').lower())
+    return ''.join(c for c in texte if not unicodedata.combining(c))
+
+def _mot_racine(mot):
+    # Pluriel simple : « vélos » correspond à « vélo »
+    return mot[:-1] if len(mot) > 3 and mot[-1] in 'sx' else mot
+
+def tokeniser(texte):
+    """Ensemble des mots normalisés d'un texte"""
+    return {_mot_racine(mot) for mot in re.findall(r'\w+', _normaliser(texte))}
+
+class AlerteCompilee:
+    """Critères d'une alerte prêts pour la correspondance (sans accès base)"""
+    __slots__ = ('id', 'utilisateur_id', 'email', 'nom_alerte', 'mots',
+                 'categorie_id', 'prix_min', 'prix_max', 'ville', 'rayon_km', 'proches')
+
+    def __init__(self, id, utilisateur_id, email, nom_alerte, mots_cles,
+                 categorie_id, prix_min, prix_max, ville, rayon_km):
+        self.id = id
+        self.utilisateur_id = utilisateur_id
+        self.email = email
+        self.nom_alerte = nom_alerte
+        self.mots = tokeniser(mots_cles)
+        self.categorie_id = categorie_id
+        self.prix_min = prix_min
+        self.prix_max = prix_max
+        self.ville = _normaliser(ville).strip()
+        self.rayon_km = rayon_km
+        # Ids des annonces du lot dans le rayon ; None si la ville n'a pas pu être géocodée
+        self.proches = None
+
+    def accepte(self, annonce):
+        """Prédicats hors mots-clés (catégorie, prix, ville ou rayon)"""
+        if self.categorie_id and annonce.categorie_id != self.categorie_id:
+            return False
+        if self.prix_min and annonce.prix < self.prix_min:
+            return False
+        if self.prix_max and annonce.prix > self.prix_max:
+            return False
+        if self.ville:
+            if self.proches is not None and annonce.situee:
+                return annonce.id in self.proches
+            if self.ville not in annonce.ville_normalisee:
+                return False
+        return True
+
+class IndexAlertes:
+    """Index inversé des alertes : mot-clé le plus long -> alertes
+    
+    Les alertes sans mots-clés sont rangées par catégorie. Une annonce n'est
+    comparée qu'aux alertes partageant un de ses mots ou sa catégorie.
+    """
+
+    def __init__(self, alertes):
+        self.par_mot = defaultdict(list)
+        self.sans_mots = defaultdict(list)
+        for alerte in alertes:
+            if alerte.mots:
+                cle = max(alerte.mots, key=lambda mot: (len(mot), mot))
+                self.par_mot[cle].append(alerte)
+            else:
+                self.sans_mots[alerte.categorie_id].append(alerte)
+
+    def correspondances(self, annonce):
+        candidates = list(self.sans_mots.get(None, ()))
+        candidates.extend(self.sans_mots.get(annonce.categorie_id, ()))
+        for mot in annonce.mots:
+            for alerte in self.par_mot.get(mot, ()):
+                if alerte.mots <= annonce.mots:
+                    candidates.append(alerte)
+        return [alerte for alerte in candidates if alerte.accepte(annonce)]
+
+def charger_alertes(alertes=None, taille_lot=ALERTES_PAR_LOT):
+    """Alertes (actives par défaut) compilées, par lots (mémoire bornée)"""
+    if alertes is None:
+        alertes = Alerte.objects.filter(active=True)
+    lot = []
+    for ligne in alertes.values_list(
+        'id', 'utilisateur_id', 'utilisateur__email', 'nom_alerte', 'mots_cles',
+        'categorie_id', 'prix_min', 'prix_max', 'ville', 'rayon_km'
+    ).order_by('id').iterator(chunk_size=taille_lot):
+        lot.append(AlerteCompilee(*ligne))
+        if len(lot) >= taille_lot:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+def annonces_du_lot(debut, fin):
+    """Annonces actives créées dans la fenêtre ]debut, fin], les plus récentes d'abord"""
+    annonces = list(Annonce.objects.filter(
+        active=True, date_creation__gt=debut, date_creation__lte=fin
+    ).only(
+        'id', 'titre', 'description', 'prix', 'categorie_id', 'ville'
+    ).annotate(
+        loc_latitude=F('localisation__latitude'),
+        loc_longitude=F('localisation__longitude'),
+    ).order_by('-date_creation'))
+    for annonce in annonces:
+        annonce.mots = tokeniser(f'{annonce.titre} {annonce.description}')
+        annonce.ville_normalisee = _normaliser(annonce.ville)
+        annonce.situee = annonce.loc_latitude is not None and annonce.loc_longitude is not None
+    return annonces
+
+def localiser_alertes(alertes, annonces):
+    """Renseigne alerte.proches : annonces du lot à moins de rayon_km de la ville de l'alerte
+    
+    Un seul calcul NumPy par couple (ville, rayon), partagé par les alertes identiques.
+    """
+    situees = [annonce for annonce in annonces if annonce.situee]
+    avec_ville = [alerte for alerte in alertes if alerte.ville]
+    if not situees or not avec_ville:
+        return
+    coordonnees = [(annonce.loc_latitude, annonce.loc_longitude) for annonce in situees]
+    villes = geocoder_lot(alerte.ville for alerte in avec_ville)
+    proches = {}
+    for alerte in avec_ville:
+        centre = villes.get(alerte.ville)
+        if centre is None:
+            continue
+        cle = (alerte.ville, alerte.rayon_km)
+        if cle not in proches:
+            indices, _ = plus_proches(
+                (centre['latitude'], centre['longitude']), coordonnees, rayon_km=alerte.rayon_km
+            )
+            proches[cle] = {situees[i].id for i in indices}
+        alerte.proches = proches[cle]
+
+def faire_correspondre(annonces, alertes=None, limite=None, taille_lot=ALERTES_PAR_LOT):
+    """Correspondances {alerte: [ids d'annonces]} pour tout un lot d'annonces
+    
+    `limite` plafonne le nombre d'annonces retenues par alerte (les premières du lot).
+    """
+    resultats = {}
+    if not annonces:
+        return resultats
+    for lot in charger_alertes(alertes, taille_lot):
+        localiser_alertes(lot, annonces)
+        index = IndexAlertes(lot)
+        for annonce in annonces:
+            for alerte in index.correspondances(annonce):
+                annonce_ids = resultats.setdefault(alerte, [])
+                if limite is None or len(annonce_ids) < limite:
+                    annonce_ids.append(annonce.id)
+    return resultats
+
+# notifications.py (Envoi groupé des notifications et des emails)
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from .models import Notification
+
+NOTIFICATIONS_PAR_LOT = 1000
+
+def creer_notifications(correspondances, taille_lot=NOTIFICATIONS_PAR_LOT):
+    """Une notification par alerte déclenchée, insérées par lots (bulk_create)"""
+    notifications = [
+        Notification(
+            utilisateur_id=alerte.utilisateur_id,
+            type_notification='systeme',
+            titre=f'Nouvelle(s) annonce(s) pour "{alerte.nom_alerte}"',
+            message=f'{len(annonce_ids)} nouvelle(s) annonce(s) correspondent à votre alerte.'
+        )
+        for alerte, annonce_ids in correspondances.items()
+    ]
+    Notification.objects.bulk_create(notifications, batch_size=taille_lot)
+    return len(notifications)
+
+def construire_digests(correspondances):
+    """Un email récapitulatif par utilisateur (sérialisable en JSON pour Celery)"""
+    digests = {}
+    for alerte, annonce_ids in correspondances.items():
+        if not alerte.email:
+            continue
+        digest = digests.setdefault(alerte.utilisateur_id, {'email': alerte.email, 'alertes': []})
+        digest['alertes'].append([alerte.nom_alerte, len(annonce_ids)])
+    return list(digests.values())
+
+def message_digest(digest):
+    total = sum(nombre for _, nombre in digest['alertes'])
+    lignes = '\n'.join(
+        f'- {nom} : {nombre} nouvelle(s) annonce(s)' for nom, nombre in digest['alertes']
+    )
+    return EmailMessage(
+        subject=f'Alerte : {total} nouvelle(s) annonce(s)',
+        body=f'Bonjour,\n\nDe nouvelles annonces correspondent à vos alertes :\n{lignes}',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[digest['email']]
+    )
+
+def envoyer_digests(digests, connection=None):
+    """Envoie les digests sur une seule connexion SMTP, au débit ALERTES_EMAILS_PAR_SECONDE
+    
+    Retourne le nombre d'emails envoyés. Une erreur SMTP interrompt l'envoi et
+    remonte avec `exc.envoyes`, le nombre de digests partis avant l'échec.
+    """
+    par_seconde = getattr(settings, 'ALERTES_EMAILS_PAR_SECONDE', 10)
+    connection = connection or get_connection()
+    envoyes = 0
+    try:
+        with connection:
+            for debut in range(0, len(digests), par_seconde):
+                depart = time.monotonic()
+                # Un email à la fois : chaque digest remis est compté, même si la suite du lot échoue
+                for digest in digests[debut:debut + par_seconde]:
+                    connection.send_messages([message_digest(digest)])
+                    envoyes += 1
+                # Limitation de débit : au plus un lot par seconde
+                attente = 1 - (time.monotonic() - depart)
+                if envoyes < len(digests) and attente > 0:
+                    time.sleep(attente)
+    except Exception as exc:
+        exc.envoyes = envoyes
+        raise
+    return envoyes
+
+# vues.py (Compteurs de vues par tranches horaires dans Redis)
+import logging
+import time
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+HEURES_CONSERVEES = 7 * 24
+ANNONCES_VUES_KEY = 'vues:annonces'
+
+def _heure_courante():
+    return int(time.time() // 3600)
+
+def _cle(annonce_id):
+    # Hash Redis : champ = heure (depuis l'epoch), valeur = vues de cette heure
+    return f'vues:{annonce_id}'
+
+def enregistrer_vue(annonce_id):
+    """Incrémenter la tranche horaire courante (une requête Redis pipelinée)"""
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.hincrby(_cle(annonce_id), _heure_courante(), 1)
+        pipe.expire(_cle(annonce_id), (HEURES_CONSERVEES + 1) * 3600)
+        pipe.sadd(ANNONCES_VUES_KEY, annonce_id)
+        pipe.execute()
+    except Exception:
+        # Le compteur de tendance ne doit jamais bloquer l'affichage de l'annonce
+        logger.exception("Échec de l'enregistrement de la vue %s", annonce_id)
+
+def tranches_horaires(annonce_ids):
+    """Tranches {annonce_id: {heure: vues}} des 7 derniers jours, en un aller-retour"""
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline(transaction=False)
+    for annonce_id in annonce_ids:
+        pipe.hgetall(_cle(annonce_id))
+    limite = _heure_courante() - HEURES_CONSERVEES
+    
+    resultats = {}
+    perimees = redis.pipeline(transaction=False)
+    for annonce_id, tranches in zip(annonce_ids, pipe.execute()):
+        tranches = {int(heure): int(vues) for heure, vues in tranches.items()}
+        anciennes = [heure for heure in tranches if heure <= limite]
+        if anciennes:
+            perimees.hdel(_cle(annonce_id), *anciennes)
+        resultats[annonce_id] = {h: v for h, v in tranches.items() if h > limite}
+    perimees.execute()
+    return resultats
+
+def fenetres_vues(annonce_ids):
+    """Vues glissantes {annonce_id: (24 dernières heures, 7 derniers jours)}"""
+    depuis_hier = _heure_courante() - 24
+    return {
+        annonce_id: (
+            sum(vues for heure, vues in tranches.items() if heure > depuis_hier),
+            sum(tranches.values()),
+        )
+        for annonce_id, tranches in tranches_horaires(annonce_ids).items()
+    }
+
+def tendance_vues(annonce_id, heures=HEURES_CONSERVEES):
+    """Vues heure par heure, de la plus ancienne à la courante (graphique vendeur)"""
+    tranches = tranches_horaires([annonce_id])[annonce_id]
+    maintenant = _heure_courante()
+    return [tranches.get(heure, 0) for heure in range(maintenant - heures + 1, maintenant + 1)]
+
+# miniatures.py (Dérivés des photos d'annonces : tailles THUMBNAIL_SIZES + WebP)
+import os
+import tempfile
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+def tailles_miniatures():
+    return getattr(settings, 'THUMBNAIL_SIZES', {})
+
+def _cle_cache(nom, taille, webp):
+    return f'miniature:{taille}:{int(webp)}:{nom}'
+
+def nom_miniature(nom, taille, webp=False, alpha=False):
+    """À côté de l'original : annonces/photos/x.jpg -> annonces/photos/x_medium.jpg"""
+    racine, _ = os.path.splitext(nom)
+    return f"{racine}_{taille}.{'webp' if webp else ('png' if alpha else 'jpg')}"
+
+def generer_miniatures(nom, tailles=None):
+    """Un seul décodage de l'original, tailles produites de la plus grande à la plus petite"""
+    toutes = tailles_miniatures()
+    with default_storage.open(nom, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if alpha else 'RGB')
+    
+    generees = {}
+    for taille in sorted(tailles or toutes, key=lambda t: toutes[t][0] * toutes[t][1], reverse=True):
+        image.thumbnail(toutes[taille], Image.LANCZOS)
+        for webp in (False, True):
+            buffer = BytesIO()
+            if webp:
+                image.save(buffer, 'WEBP', quality=80, method=4)
+            elif alpha:
+                image.save(buffer, 'PNG', optimize=True)
+            else:
+                image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+            derive = nom_miniature(nom, taille, webp, alpha)
+            if default_storage.exists(derive):
+                default_storage.delete(derive)
+            default_storage.save(derive, ContentFile(buffer.getvalue()))
+            cache.set(_cle_cache(nom, taille, webp), derive, None)
+            generees[(taille, webp)] = derive
+    return generees
+
+# Formats réécrits en place ; les autres (GIF...) et les images animées sont laissés tels quels
+FORMATS_REENREGISTRABLES = ('JPEG', 'PNG', 'WEBP')
+
+def _webp_sans_perte(contenu):
+    """Vrai si le flux d'image du WebP est un bloc VP8L (compression sans perte)"""
+    position = 12  # après « RIFF <taille> WEBP »
+    while position + 8 <= len(contenu):
+        bloc = contenu[position:position + 4]
+        if bloc in (b'VP8 ', b'VP8L'):
+            return bloc == b'VP8L'
+        taille = int.from_bytes(contenu[position + 4:position + 8], 'little')
+        position += 8 + taille + (taille & 1)
+    return False
+
+def enregistrer_meme_format(image, sortie, format_origine, original, quality=85):
+    """Réécrit l'image dans son format d'origine (original : octets du fichier source)
+    
+    Le JPEG est recompressé ; PNG (transparence comprise) et WebP sans perte
+    restent sans perte.
+    """
+    if format_origine == 'JPEG':
+        image.convert('RGB').save(sortie, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif format_origine == 'PNG':
+        image.save(sortie, 'PNG', optimize=True)
+    elif _webp_sans_perte(original):
+        image.save(sortie, 'WEBP', lossless=True, method=6)
+    else:
+        image.save(sortie, 'WEBP', quality=quality, method=6)
+
+def normaliser_original(nom, largeur_max=None):
+    """Applique l'orientation EXIF et borne la largeur de l'original, en place
+    
+    Le format est conservé (voir enregistrer_meme_format) ; l'écriture passe
+    par un fichier temporaire renommé atomiquement.
+    """
+    largeur_max = largeur_max or getattr(settings, 'PHOTO_LARGEUR_MAX', 1600)
+    chemin = default_storage.path(nom)
+    with open(chemin, 'rb') as f:
+        original = f.read()
+    with Image.open(chemin) as image:
+        format_origine = image.format
+        # Une image animée réécrite ne garderait que sa première frame
+        if format_origine not in FORMATS_REENREGISTRABLES or getattr(image, 'is_animated', False):
+            return False
+        orientation = image.getexif().get(0x0112, 1)
+        if image.width <= largeur_max and orientation == 1:
+            return False
+        image = ImageOps.exif_transpose(image)
+        if image.width > largeur_max:
+            image = image.resize(
+                (largeur_max, int(image.height * largeur_max / image.width)),
+                Image.Resampling.LANCZOS
+            )
+        fd, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as sortie:
+                enregistrer_meme_format(image, sortie, format_origine, original)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.unlink(temporaire)
+            raise
+    return True
+
+def planifier_miniatures(nom):
+    """Met la génération des dérivés en file Celery, une fois par fichier et par quart d'heure"""
+    if cache.add(f'miniature:en_file:{nom}', 1, 900):
+        from .tasks import generer_miniatures_fichier
+        generer_miniatures_fichier.delay(nom)
+
+def _resoudre(demandes):
+    """{(nom, taille, webp): url} en un seul aller-retour de cache
+    
+    Un dérivé manquant n'est jamais produit dans la requête : l'URL de
+    l'original est renvoyée et la génération est mise en file.
+    """
+    demandes = list(dict.fromkeys(demandes))
+    connus = cache.get_many([_cle_cache(*demande) for demande in demandes])
+    urls = {}
+    manquants = []
+    for nom, taille, webp in demandes:
+        cle = _cle_cache(nom, taille, webp)
+        derive = connus.get(cle)
+        if derive is None:
+            derive = next(
+                (candidat for candidat in (nom_miniature(nom, taille, webp, alpha) for alpha in (False, True))
+                 if default_storage.exists(candidat)),
+                None
+            )
+            if derive is None:
+                manquants.append(nom)
+                urls[(nom, taille, webp)] = default_storage.url(nom)
+                continue
+            cache.set(cle, derive, None)
+        urls[(nom, taille, webp)] = default_storage.url(derive)
+    for nom in dict.fromkeys(manquants):
+        planifier_miniatures(nom)
+    return urls
+
+def urls_miniatures_lot(noms, tailles=None):
+    """{nom: {taille: {'jpg': url, 'webp': url}}} pour toute une page, en un aller-retour de cache"""
+    tailles = [taille for taille in (tailles or tailles_miniatures()) if taille in tailles_miniatures()]
+    noms = [nom for nom in dict.fromkeys(noms) if nom]
+    urls = _resoudre(
+        (nom, taille, webp) for nom in noms for taille in tailles for webp in (False, True)
+    )
+    return {
+        nom: {
+            taille: {'jpg': urls[(nom, taille, False)], 'webp': urls[(nom, taille, True)]}
+            for taille in tailles
+        }
+        for nom in noms
+    }
+
+def url_miniature(nom, taille='medium', webp=False):
+    """URL du dérivé, ou de l'original tant qu'il n'est pas généré"""
+    if not nom:
+        return None
+    if taille not in tailles_miniatures():
+        return default_storage.url(nom)
+    return urls_miniatures_lot([nom], [taille])[nom][taille]['webp' if webp else 'jpg']
+
+# templatetags/annonce_miniatures.py (+ templatetags/__init__.py vide)
+from django import template
+from ..miniatures import url_miniature, urls_miniatures_lot
+from ..models import PhotoAnnonce
+
+register = template.Library()
+
+@register.simple_tag
+def precharger_miniatures(objets, *tailles, via=None):
+    """Miniatures de toute une liste en un aller-retour de cache
+    
+    {% precharger_miniatures page_obj "medium" as annonces %} puis, dans la
+    boucle, {{ annonce.miniatures.medium.jpg }} et {{ annonce.miniatures.medium.webp }}.
+    Accepte des annonces (photo principale, une seule requête) ou des photos ;
+    via="annonce" lit l'annonce de chaque objet (conversations...).
+    """
+    objets = list(objets)
+    cibles = [getattr(objet, via) if via else objet for objet in objets]
+    principales = {}
+    annonce_ids = [cible.pk for cible in cibles if not isinstance(cible, PhotoAnnonce)]
+    if annonce_ids:
+        photos = PhotoAnnonce.objects.filter(annonce_id__in=annonce_ids).order_by('ordre', 'id')
+        for annonce_id, image in photos.values_list('annonce_id', 'image'):
+            principales.setdefault(annonce_id, image)
+    noms = [
+        cible.image.name if isinstance(cible, PhotoAnnonce) else principales.get(cible.pk)
+        for cible in cibles
+    ]
+    urls = urls_miniatures_lot(noms, tailles or ['medium'])
+    for cible, nom in zip(cibles, noms):
+        cible.miniatures = urls.get(nom, {})
+    return objets
+
+@register.filter
+def miniature(image, taille='medium'):
+    """URL de la miniature : {{ photo.image|miniature:"small" }}"""
+    return url_miniature(getattr(image, 'name', image), taille)
+
+@register.filter
+def miniature_webp(image, taille='medium'):
+    """URL de la variante WebP (pour <source type="image/webp">)"""
+    return url_miniature(getattr(image, 'name', image), taille, webp=True)
+
 # tasks.py (Tâches Celery pour les traitements asynchrones)
+from datetime import timedelta
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django_redis import get_redis_connection
 from .models import *
+from .alertes import annonces_du_lot, faire_correspondre
+from .notifications import creer_notifications, construire_digests, envoyer_digests
+from .vues import ANNONCES_VUES_KEY, fenetres_vues
+from .miniatures import generer_miniatures, normaliser_original
+
+# Annonces signalées au plus par une alerte lors de sa première vérification
+ALERTES_PREMIER_ENVOI = 5
+
+# Emails envoyés par connexion SMTP avant de la renouveler
+EMAILS_PAR_CONNEXION = 500
+
+# Statistiques : annonces recalculées par lot et repère du dernier passage
+STATS_PAR_LOT = 1000
+STATS_REPERE_KEY = 'statistiques_annonces:dernier_passage'
+# Sans repère, le passage suivant est complet : au moins un par jour même sans beat
+STATS_REPERE_TTL = 24 * 3600
 
 @shared_task
 def envoyer_alerte_nouvelles_annonces():
-    """Vérifier les alertes et envoyer des notifications"""
-    alertes_actives = Alerte.objects.filter(active=True)
+    """Faire correspondre les nouvelles annonces à toutes les alertes en une passe"""
+    fin = timezone.now()
+    # Jamais plus d'ALERTES_FENETRE_HEURES d'annonces par passage, même après une longue interruption
+    plancher = fin - timedelta(hours=getattr(settings, 'ALERTES_FENETRE_HEURES', 24))
+    alertes = Alerte.objects.filter(active=True, date_creation__lte=fin)
     
-    for alerte in alertes_actives:
-        # Construire la requête basée sur les critères de l'alerte
-        queryset = Annonce.objects.filter(active=True)
-        
-        if alerte.mots_cles:
-            queryset = queryset.filter(
-                Q(titre__icontains=alerte.mots_cles) |
-                Q(description__icontains=alerte.mots_cles)
-            )
-        
-        if alerte.categorie:
-            queryset = queryset.filter(categorie=alerte.categorie)
-        
-        if alerte.prix_min:
-            queryset = queryset.filter(prix__gte=alerte.prix_min)
-        
-        if alerte.prix_max:
-            queryset = queryset.filter(prix__lte=alerte.prix_max)
-        
-        if alerte.ville:
-            queryset = queryset.filter(ville__icontains=alerte.ville)
-        
-        # Nouvelles annonces depuis la dernière vérification
-        if alerte.derniere_verification:
-            nouvelles_annonces = queryset.filter(
-                date_creation__gt=alerte.derniere_verification
-            )
-        else:
-            nouvelles_annonces = queryset[:5]  # Limiter pour le premier envoi
-        
-        if nouvelles_annonces.exists():
-            # Créer notification
-            Notification.objects.create(
-                utilisateur=alerte.utilisateur,
-                type_notification='systeme',
-                titre=f'Nouvelle(s) annonce(s) pour "{alerte.nom_alerte}"',
-                message=f'{nouvelles_annonces.count()} nouvelle(s) annonce(s) correspondent à votre alerte.'
-            )
-            
-            # Envoyer email si configuré
-            if alerte.utilisateur.email:
-                send_mail(
-                    subject=f'Alerte : {nouvelles_annonces.count()} nouvelle(s) annonce(s)',
-                    message=f'Bonjour,\n\n{nouvelles_annonces.count()} nouvelle(s) annonce(s) correspondent à votre alerte "{alerte.nom_alerte}".',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[alerte.utilisateur.email]
-                )
-        
-        # Mettre à jour la date de dernière vérification
-        alerte.derniere_verification = timezone.now()
-        alerte.save()
+    # Alertes déjà vérifiées ensemble : le dernier passage borne le lot
+    verifiees = alertes.filter(derniere_verification__isnull=False)
+    debut = verifiees.aggregate(debut=Max('derniere_verification'))['debut']
+    debut = max(debut, plancher) if debut else plancher
+    correspondances = faire_correspondre(annonces_du_lot(debut, fin), verifiees)
+    
+    # Nouvelles alertes : premier envoi limité aux annonces les plus récentes de la fenêtre
+    nouvelles = alertes.filter(derniere_verification__isnull=True)
+    if nouvelles.exists():
+        correspondances.update(faire_correspondre(
+            annonces_du_lot(plancher, fin), nouvelles, limite=ALERTES_PREMIER_ENVOI
+        ))
+    
+    creer_notifications(correspondances)
+    
+    # Les emails partent dans une tâche distincte, relancée sans refaire la correspondance
+    digests = construire_digests(correspondances)
+    if digests:
+        envoyer_digests_alertes.delay(digests)
+    
+    # Mettre à jour la date de dernière vérification (une seule requête)
+    alertes.update(derniere_verification=fin)
+    return len(correspondances)
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def envoyer_digests_alertes(self, digests):
+    """Envoyer les emails récapitulatifs des alertes (reprise là où l'envoi a échoué)"""
+    envoyes = 0
+    try:
+        for debut in range(0, len(digests), EMAILS_PAR_CONNEXION):
+            envoyes += envoyer_digests(digests[debut:debut + EMAILS_PAR_CONNEXION])
+    except Exception as exc:
+        # Reprise au premier digest non remis, y compris au milieu d'une connexion
+        envoyes += getattr(exc, 'envoyes', 0)
+        raise self.retry(exc=exc, args=[digests[envoyes:]])
+    return envoyes
 
 @shared_task
 def nettoyer_notifications_anciennes():
@@ -428,20 +1170,111 @@ def nettoyer_notifications_anciennes():
     Notification.objects.filter(date_creation__lt=limite).delete()
 
 @shared_task
-def calculer_statistiques_annonces():
-    """Calculer les statistiques des annonces"""
-    for annonce in Annonce.objects.filter(active=True):
-        stats, created = Statistique.objects.get_or_create(annonce=annonce)
-        
-        # Calculer favoris
-        stats.favoris_count = annonce.favoris.count()
-        
-        # Calculer messages
-        stats.messages_count = Message.objects.filter(
-            conversation__annonce=annonce
-        ).count()
-        
-        stats.save()
+def calculer_statistiques_annonces(complet=False):
+    """Recalculer favoris et messages des annonces modifiées depuis le dernier passage
+    
+    Les suppressions de favoris ne laissent pas de trace datée : un passage
+    complet (complet=True chaque nuit, ou repère expiré) les rattrape.
+    """
+    debut = timezone.now()
+    depuis = None if complet else cache.get(STATS_REPERE_KEY)
+    
+    annonces = Annonce.objects.filter(active=True)
+    if depuis:
+        annonces = annonces.filter(
+            Q(pk__in=Favori.objects.filter(date_ajout__gte=depuis).values('annonce_id')) |
+            Q(pk__in=Message.objects.filter(date_envoi__gte=depuis).values('conversation__annonce_id')) |
+            Q(statistiques__isnull=True)
+        )
+    annonce_ids = list(annonces.values_list('id', flat=True))
+    
+    for i in range(0, len(annonce_ids), STATS_PAR_LOT):
+        lot = annonce_ids[i:i + STATS_PAR_LOT]
+        # Agrégats groupés : deux requêtes par lot
+        favoris = dict(
+            Favori.objects.filter(annonce_id__in=lot)
+            .values_list('annonce_id').annotate(n=Count('id'))
+        )
+        messages_count = dict(
+            Message.objects.filter(conversation__annonce_id__in=lot)
+            .values_list('conversation__annonce_id').annotate(n=Count('id'))
+        )
+        # INSERT ... ON CONFLICT (annonce_id) DO UPDATE
+        Statistique.objects.bulk_create(
+            [
+                Statistique(
+                    annonce_id=annonce_id,
+                    favoris_count=favoris.get(annonce_id, 0),
+                    messages_count=messages_count.get(annonce_id, 0)
+                )
+                for annonce_id in lot
+            ],
+            update_conflicts=True,
+            unique_fields=['annonce'],
+            update_fields=['favoris_count', 'messages_count']
+        )
+    
+    # Repère pris avant les agrégats : une écriture concurrente sera revue au prochain passage
+    cache.set(STATS_REPERE_KEY, debut, STATS_REPERE_TTL)
+    return len(annonce_ids)
+
+@shared_task
+def synchroniser_vues_statistiques():
+    """Reporter les fenêtres glissantes de vues dans Statistique"""
+    annonce_ids = sorted(
+        int(annonce_id) for annonce_id in
+        get_redis_connection('default').smembers(ANNONCES_VUES_KEY)
+    )
+    inactives = []
+    for i in range(0, len(annonce_ids), STATS_PAR_LOT):
+        fenetres = fenetres_vues(annonce_ids[i:i + STATS_PAR_LOT])
+        existantes = set(Annonce.objects.filter(pk__in=fenetres).values_list('id', flat=True))
+        Statistique.objects.bulk_create(
+            [
+                Statistique(
+                    annonce_id=annonce_id,
+                    vues_aujourd_hui=jour,
+                    vues_cette_semaine=semaine
+                )
+                for annonce_id, (jour, semaine) in fenetres.items()
+                if annonce_id in existantes
+            ],
+            update_conflicts=True,
+            unique_fields=['annonce'],
+            update_fields=['vues_aujourd_hui', 'vues_cette_semaine']
+        )
+        # Plus de vue depuis une semaine (compteurs remis à zéro ci-dessus) : sortir du suivi
+        inactives.extend(
+            annonce_id for annonce_id, (_, semaine) in fenetres.items()
+            if not semaine or annonce_id not in existantes
+        )
+    if inactives:
+        get_redis_connection('default').srem(ANNONCES_VUES_KEY, *inactives)
+    return len(annonce_ids)
+
+def _traiter_image(nom):
+    # Toujours normaliser d'abord : les dérivés ne partent jamais d'un original brut
+    normaliser_original(nom)
+    return len(generer_miniatures(nom))
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generer_miniatures_fichier(self, nom):
+    """Produire les dérivés d'une image demandés avant leur génération (voir url_miniature)"""
+    try:
+        return _traiter_image(nom)
+    except OSError as exc:
+        raise self.retry(exc=exc)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def traiter_photo_annonce(self, photo_id):
+    """Traitement d'une photo après l'enregistrement de l'annonce : original normalisé puis miniatures"""
+    nom = PhotoAnnonce.objects.filter(pk=photo_id).values_list('image', flat=True).first()
+    if not nom:
+        return None
+    try:
+        return _traiter_image(nom)
+    except OSError as exc:
+        raise self.retry(exc=exc)
 
 # consumers.py (WebSockets pour notifications temps réel)
 import json
@@ -450,10 +1283,18 @@ from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """Notifications et messagerie temps réel (un groupe par utilisateur)
+    
+    Événements client : {"type": "typing", "conversation_id": ...}
+    et {"type": "read", "conversation_id": ..., "message_id": ...}
+    """
+    
     async def connect(self):
         if self.scope['user'].is_authenticated:
             self.user_id = self.scope['user'].id
             self.group_name = f'notifications_{self.user_id}'
+            # Participants des conversations déjà vérifiées (pas de requête par frappe)
+            self.participants = {}
             
             await self.channel_layer.group_add(
                 self.group_name,
@@ -470,32 +1311,348 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
     
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            event = json.loads(text_data or '')
+            conversation_id = int(event['conversation_id'])
+        except (ValueError, KeyError, TypeError):
+            return
+        
+        destinataire_id = await self.get_destinataire(conversation_id)
+        if destinataire_id is None:
+            return
+        
+        if event.get('type') == 'typing':
+            data = {'conversation_id': conversation_id, 'user_id': self.user_id}
+            await self.envoyer_evenement(destinataire_id, 'typing', data)
+        elif event.get('type') == 'read':
+            try:
+                message_id = int(event['message_id'])
+            except (ValueError, KeyError, TypeError):
+                return
+            await self.marquer_lus(conversation_id, message_id)
+            data = {
+                'conversation_id': conversation_id,
+                'user_id': self.user_id,
+                'message_id': message_id,
+            }
+            await self.envoyer_evenement(destinataire_id, 'read', data)
+    
+    async def envoyer_evenement(self, user_id, event_type, data):
+        await self.channel_layer.group_send(
+            f'notifications_{user_id}',
+            {
+                'type': 'conversation_event',
+                'event': event_type,
+                'data': data
+            }
+        )
+    
+    async def get_destinataire(self, conversation_id):
+        """Autre participant de la conversation (None si l'utilisateur n'y participe pas)"""
+        if conversation_id not in self.participants:
+            self.participants[conversation_id] = await self.charger_participants(conversation_id)
+        participants = self.participants[conversation_id]
+        if not participants or self.user_id not in participants:
+            return None
+        acheteur_id, vendeur_id = participants
+        return vendeur_id if self.user_id == acheteur_id else acheteur_id
+    
+    @database_sync_to_async
+    def charger_participants(self, conversation_id):
+        from .models import Conversation
+        return Conversation.objects.filter(pk=conversation_id).values_list(
+            'acheteur_id', 'vendeur_id'
+        ).first()
+    
+    @database_sync_to_async
+    def marquer_lus(self, conversation_id, message_id):
+        from .models import Message
+        return Message.objects.filter(
+            conversation_id=conversation_id,
+            id__lte=message_id,
+            lu=False
+        ).exclude(expediteur_id=self.user_id).update(lu=True)
+    
     async def notification_message(self, event):
         await self.send(text_data=json.dumps({
             'type': 'notification',
             'data': event['data']
         }))
+    
+    async def message_nouveau(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'message',
+            'data': event['data']
+        }))
+    
+    async def conversation_event(self, event):
+        await self.send(text_data=json.dumps({
+            'type': event['event'],
+            'data': event['data']
+        }))
 
-# utils.py (Utilitaires)
-from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import Distance
-import requests
-from geopy.geocoders import Nominatim
+# routing.py (WebSockets)
+from django.urls import re_path
 
-def geocoder_adresse(adresse):
-    """Géocoder une adresse en coordonnées"""
-    try:
-        geolocator = Nominatim(user_agent="petites_annonces")
-        location = geolocator.geocode(adresse)
+websocket_urlpatterns = [
+    re_path(r'ws/notifications/$', NotificationConsumer.as_asgi()),
+]
+
+# data/villes.csv (gazetteer embarqué : Guinée et France)
+"""
+nom,pays,latitude,longitude
+Conakry,Guinée,9.509167,-13.712222
+Nzérékoré,Guinée,7.756200,-8.817900
+Kankan,Guinée,10.385400,-9.305700
+Kindia,Guinée,10.056900,-12.865800
+Labé,Guinée,11.318200,-12.283300
+Kamsar,Guinée,10.650000,-14.600000
+Mamou,Guinée,10.375500,-12.091500
+Boké,Guinée,10.940900,-14.296700
+Siguiri,Guinée,11.422800,-9.168500
+Kissidougou,Guinée,9.184800,-10.099900
+Guéckédou,Guinée,8.566700,-10.133300
+Macenta,Guinée,8.543600,-9.470800
+Faranah,Guinée,10.040400,-10.743400
+Dabola,Guinée,10.750000,-11.116700
+Télimélé,Guinée,10.900000,-13.033300
+Pita,Guinée,11.050000,-12.400000
+Dalaba,Guinée,10.694700,-12.249700
+Coyah,Guinée,9.700000,-13.383300
+Dubréka,Guinée,9.791200,-13.523000
+Fria,Guinée,10.367400,-13.584200
+Beyla,Guinée,8.683300,-8.633300
+Lola,Guinée,7.800000,-8.533300
+Kouroussa,Guinée,10.650000,-9.883300
+Forécariah,Guinée,9.433300,-13.083300
+Boffa,Guinée,10.183300,-14.033300
+Koundara,Guinée,12.483300,-13.300000
+Paris,France,48.856600,2.352200
+Marseille,France,43.296500,5.369800
+Lyon,France,45.764000,4.835700
+Toulouse,France,43.604700,1.444200
+Nice,France,43.710200,7.262000
+Nantes,France,47.218400,-1.553600
+Strasbourg,France,48.573400,7.752100
+Montpellier,France,43.610800,3.876700
+Bordeaux,France,44.837800,-0.579200
+Lille,France,50.629200,3.057300
+Rennes,France,48.117300,-1.677800
+Reims,France,49.258300,4.031700
+Le Havre,France,49.494400,0.107900
+Saint-Étienne,France,45.439700,4.387200
+Toulon,France,43.124200,5.928000
+Grenoble,France,45.188500,5.724500
+Dijon,France,47.322000,5.041500
+Angers,France,47.478400,-0.563200
+Nîmes,France,43.836700,4.360100
+Clermont-Ferrand,France,45.777200,3.087000
+Le Mans,France,48.006100,0.199600
+Aix-en-Provence,France,43.529700,5.447400
+Brest,France,48.390400,-4.486100
+Tours,France,47.394100,0.684800
+Amiens,France,49.894100,2.295800
+Limoges,France,45.833600,1.261100
+Perpignan,France,42.688700,2.894800
+Metz,France,49.119300,6.175700
+Besançon,France,47.237800,6.024100
+Orléans,France,47.903000,1.909300
+Rouen,France,49.443200,1.099900
+Caen,France,49.182900,-0.370700
+Nancy,France,48.692100,6.184400
+"""
+
+# geocodage.py (Géocodage avec cache persistant et gazetteer hors ligne)
+import csv
+import logging
+import os
+import re
+import unicodedata
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import CacheGeocodage
+
+logger = logging.getLogger(__name__)
+
+FICHIER_VILLES = os.path.join(os.path.dirname(__file__), 'data', 'villes.csv')
+
+def normaliser_adresse(adresse):
+    """Clé de cache : minuscules, sans accents, ponctuation et espaces réduits"""
+    adresse = unicodedata.normalize('NFKD', (adresse or '').lower())
+    adresse = ''.join(c for c in adresse if not unicodedata.combining(c))
+    adresse = re.sub(r"[^\w,]+", ' ', adresse)
+    return ', '.join(part.strip() for part in adresse.split(',') if part.strip())[:300]
+
+class GazetteerLocal:
+    """Géocodage hors ligne des villes du fichier embarqué"""
+    nom = 'gazetteer'
+    
+    def __init__(self, fichier=None):
+        self.villes = {}
+        with open(fichier or getattr(settings, 'GEOCODAGE_GAZETTEER', FICHIER_VILLES), encoding='utf-8') as f:
+            for ligne in csv.DictReader(f):
+                self.villes[normaliser_adresse(ligne['nom'])] = {
+                    'latitude': float(ligne['latitude']),
+                    'longitude': float(ligne['longitude']),
+                    'adresse_complete': f"{ligne['nom']}, {ligne['pays']}"
+                }
+        # Noms les plus longs d'abord : « aix en provence » avant « aix »
+        self.noms = sorted(self.villes, key=len, reverse=True)
+    
+    def geocoder(self, cle):
+        # Partie par partie (« 12 rue x, 75001 paris, france »), sans code postal
+        for partie in cle.split(', '):
+            ville = re.sub(r'\b\d+\b', ' ', partie).strip()
+            ville = ' '.join(ville.split())
+            if ville in self.villes:
+                return self.villes[ville]
+        texte = f' {cle.replace(",", " ")} '
+        for nom in self.noms:
+            if f' {nom} ' in texte:
+                return self.villes[nom]
+        return None
+
+class NominatimBackend:
+    """Géocodage réseau (OpenStreetMap), facultatif"""
+    nom = 'nominatim'
+    
+    def __init__(self):
+        from geopy.geocoders import Nominatim
+        self.client = Nominatim(user_agent="petites_annonces", timeout=5)
+    
+    def geocoder(self, cle):
+        location = self.client.geocode(cle)
         if location:
             return {
                 'latitude': location.latitude,
                 'longitude': location.longitude,
-                'adresse_complete': location.address
+                'adresse_complete': location.address[:300]
             }
-    except:
-        pass
-    return None
+        return None
+
+@lru_cache(maxsize=None)
+def get_backends():
+    """Backends de GEOCODAGE_BACKENDS, instanciés une seule fois par processus"""
+    backends = []
+    for chemin in getattr(settings, 'GEOCODAGE_BACKENDS', ['annonces.geocodage.GazetteerLocal']):
+        try:
+            backends.append(import_string(chemin)())
+        except Exception:
+            # Backend facultatif indisponible (ex: geopy non installé) : on continue sans
+            logger.exception("Backend de géocodage %s indisponible", chemin)
+    return backends
+
+def _interroger_backends(cle):
+    """(resultat, source, complet) ; complet est faux si un backend en erreur a pu manquer l'adresse"""
+    complet = True
+    for backend in get_backends():
+        try:
+            resultat = backend.geocoder(cle)
+        except Exception:
+            logger.exception("Échec du géocodage de %r par %s", cle, backend.nom)
+            complet = False
+            continue
+        if resultat:
+            return resultat, backend.nom, True
+    return None, '', complet
+
+def _echec_expire(entree):
+    """Un échec mémorisé est retenté après GEOCODAGE_ECHEC_TTL_JOURS"""
+    if entree.resultat() is not None:
+        return False
+    ttl = timedelta(days=getattr(settings, 'GEOCODAGE_ECHEC_TTL_JOURS', 7))
+    return entree.date_creation < timezone.now() - ttl
+
+def _enregistrer(resultats):
+    """Mémoriser {cle: (resultat, source)} en base, échecs compris (remplace un échec expiré)"""
+    CacheGeocodage.objects.bulk_create(
+        [
+            CacheGeocodage(
+                adresse_normalisee=cle,
+                latitude=resultat['latitude'] if resultat else None,
+                longitude=resultat['longitude'] if resultat else None,
+                adresse_complete=resultat['adresse_complete'] if resultat else '',
+                source=source
+            )
+            for cle, (resultat, source) in resultats.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['adresse_normalisee'],
+        update_fields=['latitude', 'longitude', 'adresse_complete', 'source', 'date_creation']
+    )
+
+class _NonMemorise(Exception):
+    """Adresse introuvable : l'échec ne reste pas dans le LRU du processus"""
+
+def _chercher_cle(cle):
+    entree = CacheGeocodage.objects.filter(adresse_normalisee=cle).first()
+    if entree and not _echec_expire(entree):
+        return entree.resultat()
+    resultat, source, complet = _interroger_backends(cle)
+    # Un échec n'est mémorisé que si tous les backends ont répondu
+    if complet:
+        _enregistrer({cle: (resultat, source)})
+    return resultat
+
+@lru_cache(maxsize=4096)
+def _geocoder_cle(cle):
+    resultat = _chercher_cle(cle)
+    if resultat is None:
+        raise _NonMemorise(cle)
+    return resultat
+
+def geocoder(adresse):
+    """Coordonnées d'une adresse : LRU du processus, puis table de cache, puis backends"""
+    cle = normaliser_adresse(adresse)
+    if not cle:
+        return None
+    try:
+        return dict(_geocoder_cle(cle))
+    except _NonMemorise:
+        return None
+
+def geocoder_lot(adresses):
+    """Géocoder un lot d'adresses {adresse: résultat}, chaque adresse distincte une seule fois"""
+    cles = {adresse: normaliser_adresse(adresse) for adresse in set(adresses)}
+    a_chercher = {cle for cle in cles.values() if cle}
+    
+    # Une requête pour toutes les adresses déjà en cache (échecs expirés exclus)
+    connus = {
+        entree.adresse_normalisee: entree.resultat()
+        for entree in CacheGeocodage.objects.filter(adresse_normalisee__in=a_chercher)
+        if not _echec_expire(entree)
+    }
+    reponses = {cle: _interroger_backends(cle) for cle in a_chercher - connus.keys()}
+    nouveaux = {
+        cle: (resultat, source)
+        for cle, (resultat, source, complet) in reponses.items() if complet
+    }
+    if nouveaux:
+        _enregistrer(nouveaux)
+    connus.update({cle: resultat for cle, (resultat, _, _) in reponses.items()})
+    
+    return {
+        adresse: dict(connus[cle]) if connus.get(cle) else None
+        for adresse, cle in cles.items()
+    }
+
+# utils.py (Utilitaires)
+import math
+import numpy as np
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import Distance
+from django.db.models import ExpressionWrapper, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+import requests
+from .geocodage import geocoder
+
+def geocoder_adresse(adresse):
+    """Géocoder une adresse en coordonnées (cache, gazetteer, puis réseau si configuré)"""
+    return geocoder(adresse)
 
 def calculer_distance(point1, point2):
     """Calculer la distance entre deux points"""
@@ -505,7 +1662,77 @@ def calculer_distance(point1, point2):
     except:
         return None
 
-def envoyer_notification_temps_reel(user_id, notification_data):
+RAYON_TERRE_KM = 6371.0
+KM_PAR_DEGRE_LATITUDE = 111.045
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Distance orthodromique (formule de haversine) en km"""
+    lat1, lng1, lat2, lng2 = map(math.radians, map(float, (lat1, lng1, lat2, lng2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def distances_km(origine, coordonnees):
+    """Distances haversine (km) de origine=(lat, lng) à un tableau de (lat, lng), en un calcul NumPy"""
+    points = np.radians(np.asarray(coordonnees, dtype=float).reshape(-1, 2))
+    lat0, lng0 = np.radians(np.asarray(origine, dtype=float))
+    d_lat = points[:, 0] - lat0
+    d_lng = points[:, 1] - lng0
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat0) * np.cos(points[:, 0]) * np.sin(d_lng / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def plus_proches(origine, coordonnees, k=None, rayon_km=None):
+    """(indices, distances) des k points les plus proches, triés par distance croissante
+    
+    argpartition sélectionne les k premiers en O(n) ; seuls ceux-ci sont triés.
+    """
+    distances = distances_km(origine, coordonnees)
+    indices = np.arange(len(distances))
+    if rayon_km is not None:
+        indices = indices[distances <= rayon_km]
+    if k is not None and k < len(indices):
+        indices = indices[np.argpartition(distances[indices], k)[:k]]
+    indices = indices[np.argsort(distances[indices], kind='stable')]
+    return indices, distances[indices]
+
+def boite_englobante(lat, lng, rayon_km):
+    """(lat_min, lat_max, lng_min, lng_max) contenant le cercle de rayon donné"""
+    delta_lat = rayon_km / KM_PAR_DEGRE_LATITUDE
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    delta_lng = min(rayon_km / (KM_PAR_DEGRE_LATITUDE * cos_lat), 180)
+    return (
+        max(lat - delta_lat, -90), min(lat + delta_lat, 90),
+        max(lng - delta_lng, -180), min(lng + delta_lng, 180),
+    )
+
+def expression_distance_km(lat, lng, champ_lat='localisation__latitude', champ_lng='localisation__longitude'):
+    """Expression SQL de la distance haversine depuis (lat, lng), en km"""
+    lat_rad = math.radians(lat)
+    d_lat = Radians(champ_lat) - Value(lat_rad)
+    d_lng = Radians(champ_lng) - Value(math.radians(lng))
+    a = (Power(Sin(d_lat / 2), 2)
+         + Value(math.cos(lat_rad)) * Cos(Radians(champ_lat)) * Power(Sin(d_lng / 2), 2))
+    # Borné à 1 comme haversine_km : l'arrondi peut dépasser 1 et ASIN lèverait une erreur
+    return ExpressionWrapper(
+        Value(2 * RAYON_TERRE_KM) * ASin(Sqrt(Least(a, Value(1.0)))),
+        output_field=FloatField()
+    )
+
+def filtrer_par_rayon(queryset, lat, lng, rayon_km):
+    """Annonces à moins de rayon_km, annotées par distance_km
+    
+    La boîte englobante utilise l'index (latitude, longitude) ; la distance
+    exacte n'est calculée que sur les lignes qui y tombent.
+    """
+    lat_min, lat_max, lng_min, lng_max = boite_englobante(lat, lng, rayon_km)
+    return queryset.filter(
+        localisation__latitude__range=(lat_min, lat_max),
+        localisation__longitude__range=(lng_min, lng_max),
+    ).annotate(
+        distance_km=expression_distance_km(lat, lng)
+    ).filter(distance_km__lte=rayon_km)
+
+def envoyer_notification_temps_reel(user_id, notification_data, type_evenement='notification_message'):
     """Envoyer une notification en temps réel via WebSocket"""
     from channels.layers import get_channel_layer
     from asgiref.sync import async_to_sync
@@ -516,15 +1743,33 @@ def envoyer_notification_temps_reel(user_id, notification_data):
     async_to_sync(channel_layer.group_send)(
         group_name,
         {
-            'type': 'notification_message',
+            'type': type_evenement,
             'data': notification_data
         }
     )
 
+def diffuser_message(message):
+    """Pousser un nouveau message à l'autre participant de la conversation"""
+    conversation = message.conversation
+    if message.expediteur_id == conversation.acheteur_id:
+        destinataire_id = conversation.vendeur_id
+    else:
+        destinataire_id = conversation.acheteur_id
+    
+    envoyer_notification_temps_reel(destinataire_id, {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'expediteur_id': message.expediteur_id,
+        'expediteur': message.expediteur.username,
+        'contenu': message.contenu,
+        'date_envoi': message.date_envoi.isoformat(),
+    }, type_evenement='message_nouveau')
+
 # management/commands/import_donnees_test.py
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from annonces.models import *
+from annonces.geocodage import geocoder_lot
 import random
 from datetime import datetime, timedelta
 
@@ -553,8 +1798,9 @@ class Command(BaseCommand):
         users = User.objects.all()
         categories = Categorie.objects.all()
         
+        annonces = []
         for i in range(options['nb_annonces']):
-            annonce = Annonce.objects.create(
+            annonces.append(Annonce.objects.create(
                 titre=f'Annonce test {i}',
                 description=f'Description détaillée de l\'annonce {i}',
                 prix=random.randint(10, 5000),
@@ -564,17 +1810,21 @@ class Command(BaseCommand):
                 code_postal=f'{random.randint(10000, 99999)}',
                 urgent=random.choice([True, False]),
                 vues_count=random.randint(0, 100)
-            )
-            
-            # Ajouter localisation
-            coords = geocoder_adresse(f'{annonce.ville}, France')
+            ))
+        
+        # Ajouter localisation : chaque ville n'est géocodée qu'une fois
+        coordonnees = geocoder_lot(f'{annonce.ville}, France' for annonce in annonces)
+        localisations = []
+        for annonce in annonces:
+            coords = coordonnees.get(f'{annonce.ville}, France')
             if coords:
-                Localisation.objects.create(
+                localisations.append(Localisation(
                     annonce=annonce,
                     latitude=coords['latitude'],
                     longitude=coords['longitude'],
                     adresse_complete=coords['adresse_complete']
-                )
+                ))
+        Localisation.objects.bulk_create(localisations)
         
         self.stdout.write(
             self.style.SUCCESS(
@@ -615,6 +1865,20 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Paris'
+from celery.schedules import crontab
+CELERY_BEAT_SCHEDULE = {
+    # Incrémental : annonces dont les favoris ou messages ont changé
+    'statistiques-annonces': {
+        'task': 'annonces.tasks.calculer_statistiques_annonces',
+        'schedule': 15 * 60,
+    },
+    # Complet chaque nuit : rattrape les favoris et messages supprimés
+    'statistiques-annonces-complet': {
+        'task': 'annonces.tasks.calculer_statistiques_annonces',
+        'schedule': crontab(hour=3, minute=30),
+        'kwargs': {'complet': True},
+    },
+}
 
 # Cache Redis
 CACHES = {
@@ -646,9 +1910,24 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'your-email@gmail.com'
 EMAIL_HOST_PASSWORD = 'your-app-password'
 DEFAULT_FROM_EMAIL = 'Petites Annonces <noreply@petites-annonces.com>'
+ALERTES_EMAILS_PAR_SECONDE = 10  # Débit maximal des emails d'alerte
+ALERTES_FENETRE_HEURES = 24  # Ancienneté maximale des annonces signalées par les alertes
 
 # Géolocalisation
 GEOIP_PATH = os.path.join(BASE_DIR, 'geoip')
+# Backends interrogés dans l'ordre ; retirer Nominatim pour un géocodage 100 % hors ligne
+GEOCODAGE_BACKENDS = [
+    'annonces.geocodage.GazetteerLocal',
+    'annonces.geocodage.NominatimBackend',
+]
+GEOCODAGE_ECHEC_TTL_JOURS = 7  # Une adresse introuvable est recherchée à nouveau après ce délai
+
+# Miniatures des photos (générées par Celery ; l'original est servi tant qu'elles manquent)
+THUMBNAIL_SIZES = {
+    'small': (150, 150),
+    'medium': (300, 300),
+    'large': (800, 600),
+}
 
 # Optimisations
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
@@ -51,6 +51,13 @@ class Annonce(models.Model):
         ordering = ['-date_creation']
         verbose_name = "Annonce"
         verbose_name_plural = "Annonces"
+        indexes = [
+            # Pagination par curseur : (filtre, clé de tri, id)
+            models.Index(fields=['active', 'date_creation', 'id'], name='idx_annonce_keyset_date'),
+            models.Index(fields=['active', 'prix', 'id'], name='idx_annonce_keyset_prix'),
+            models.Index(fields=['active', 'vues_count', 'id'], name='idx_annonce_keyset_vues'),
+            models.Index(fields=['vendeur', 'date_creation', 'id'], name='idx_annonce_keyset_vendeur'),
+        ]
     
     def __str__(self):
         return self.titre
@@ -63,16 +70,32 @@ class Annonce(models.Model):
         return self.photos.first()
     
     def incrementer_vues(self):
-        self.vues_count += 1
-        self.save(update_fields=['vues_count'])
+        # Incrément atomique en base : pas de perte sous accès concurrents
+        Annonce.objects.filter(pk=self.pk).update(vues_count=models.F('vues_count') + 1)
+        # Tranche horaire Redis pour les fenêtres jour / semaine de Statistique
+        from .vues import enregistrer_vue
+        enregistrer_vue(self.pk)
 
 class PhotoAnnonce(models.Model):
     annonce = models.ForeignKey(Annonce, on_delete=models.CASCADE, related_name='photos')
     image = models.ImageField(upload_to='annonces/photos/%Y/%m/')
     ordre = models.PositiveIntegerField(default=0)
+    # Optimisation : SHA-256 du fichier optimisé et version de l'algorithme appliqué
+    empreinte = models.CharField(max_length=64, blank=True)
+    version_optimisation = models.PositiveSmallIntegerField(default=0)
     
     class Meta:
         ordering = ['ordre']
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nom du fichier chargé : permet de détecter un remplacement d'image
+        instance._image_chargee = instance.__dict__.get('image')
+        return instance
+    
+    def image_modifiee(self):
+        return str(getattr(self, '_image_chargee', '') or '') != self.image.name
 
 class Favori(models.Model):
     utilisateur = models.ForeignKey(User, on_delete=models.CASCADE)